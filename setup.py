@@ -5,6 +5,6 @@ setup(
     version="0.2dev",
     packages=['velopyraptor', 'velopyraptor.distributions',],
     license='Apache License, Version 2.0',
-    install_requires=['bitarray', 'networkx', 'numpy',],
+    install_requires=['bitarray', 'numpy',],
     long_description=open('README.txt').read()
 )
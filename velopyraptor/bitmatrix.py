@@ -0,0 +1,476 @@
+"""
+Copyright [2013] [James Absalon]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+A bit matrix over GF(2) packed into 64 bit words.  Each row of the matrix
+is a row of a 2D numpy uint64 array.  Packing the bits lets numpy do row
+XORs, popcounts and column extraction on whole words instead of walking
+single bits in python.
+
+Columns are logical.  The matrix keeps a map from each logical column to
+the physical bit holding it so exchanging two columns only swaps two
+entries of the map.  Physical column p of a row lives in word p / 64 at
+bit p % 64.
+"""
+import numpy
+from bitarray import bitarray
+
+WORD_BITS = 64
+WORD_DTYPE = 'uint64'
+
+# Number of ones in every possible 16 bit value.  Popcounts are done by
+# viewing words as 16 bit values and looking them up in this table.
+POPCOUNT = numpy.zeros(1 << 16, dtype='uint8')
+for _bit in xrange(16):
+    POPCOUNT += (numpy.arange(1 << 16) >> _bit & 1).astype('uint8')
+
+# Shift amounts for every bit within a word
+SHIFTS = numpy.arange(WORD_BITS, dtype=WORD_DTYPE)
+
+
+def width(columns):
+    """
+    Returns the number of words needed to hold columns bits
+
+    Arguments:
+    columns -- Integer number of columns
+    """
+    return (columns + WORD_BITS - 1) // WORD_BITS
+
+
+def pack(bits):
+    """
+    Packs the last axis of a boolean array into uint64 words
+
+    Arguments:
+    bits -- Numpy array of booleans (or 0s and 1s)
+
+    Returns a numpy array of uint64 words
+    """
+    bits = numpy.asarray(bits, dtype=bool)
+    columns = bits.shape[-1]
+    padded = width(columns) * WORD_BITS
+    if padded != columns:
+        pad = [(0, 0)] * (bits.ndim - 1) + [(0, padded - columns)]
+        bits = numpy.pad(bits, pad, 'constant')
+    bits = bits.reshape(bits.shape[:-1] + (padded // WORD_BITS, WORD_BITS))
+    return (bits.astype(WORD_DTYPE) << SHIFTS).sum(axis=-1, dtype=WORD_DTYPE)
+
+
+def unpack(words, columns):
+    """
+    Unpacks the last axis of an array of uint64 words into booleans
+
+    Arguments:
+    words   -- Numpy array of uint64 words
+    columns -- Integer number of bits to keep
+
+    Returns a numpy array of booleans
+    """
+    words = numpy.asarray(words, dtype=WORD_DTYPE)
+    bits = (words[..., numpy.newaxis] >> SHIFTS) & numpy.uint64(1)
+    bits = bits.reshape(words.shape[:-1] + (words.shape[-1] * WORD_BITS,))
+    return bits[..., :columns].astype(bool)
+
+
+def popcount(words):
+    """
+    Counts the ones along the last axis of an array of uint64 words
+
+    Arguments:
+    words -- Numpy array of uint64 words
+
+    Returns an integer for a single row or a numpy array of counts
+    """
+    words = numpy.ascontiguousarray(words, dtype=WORD_DTYPE)
+    counts = POPCOUNT[words.view('uint16')]
+    return counts.sum(axis=-1, dtype='int64')
+
+
+def range_mask(columns, start, end):
+    """
+    Creates a row of words with ones in columns start through end - 1
+
+    Arguments:
+    columns -- Integer total number of columns
+    start   -- Integer first column set
+    end     -- Integer column after the last column set
+    """
+    bits = numpy.zeros(columns, dtype=bool)
+    bits[start:end] = True
+    return pack(bits)
+
+
+class BitMatrix(object):
+    """
+    Matrix over GF(2) backed by a 2D numpy array of uint64 words
+    """
+
+    def __init__(self, rows, columns, words=None, order=None):
+        """
+        Arguments:
+        rows    -- Integer number of rows
+        columns -- Integer number of columns
+
+        Keyword Arguments:
+        words -- Optional (rows x width) uint64 array to use as the matrix
+        order -- Optional array mapping logical columns to physical columns
+        """
+        self.rows = rows
+        self.columns = columns
+        self.width = width(columns)
+        if words is None:
+            words = numpy.zeros((rows, self.width), dtype=WORD_DTYPE)
+        self.words = words
+        if order is None:
+            order = numpy.arange(columns)
+        self.order = order
+
+    @classmethod
+    def from_bitarrays(cls, rows):
+        """
+        Creates a bit matrix from a list of equal length bitarrays
+
+        Arguments:
+        rows -- List of bitarrays
+        """
+        columns = len(rows[0]) if len(rows) else 0
+        nbytes = (columns + 7) // 8
+        raw = "".join([bitarray(row, endian='big').tobytes() for row in rows])
+        bits = numpy.unpackbits(numpy.frombuffer(raw, dtype='uint8'))
+        bits = bits.reshape(len(rows), nbytes * 8)[:, :columns]
+        return cls(len(rows), columns, pack(bits))
+
+    def tobitarrays(self):
+        """
+        Returns the matrix as a list of bitarrays
+        """
+        result = []
+        for row in self.tobool():
+            ba = bitarray(endian='big')
+            ba.frombytes(numpy.packbits(row).tobytes())
+            result.append(ba[:self.columns])
+        return result
+
+    def tobool(self, start=0, end=None):
+        """
+        Returns rows start through end - 1 as a 2D numpy array of booleans
+        with columns in logical order
+
+        Keyword Arguments:
+        start -- Integer first row
+        end   -- Integer row after the last row
+        """
+        return unpack(self.words[start:end], self.columns)[:, self.order]
+
+    def copy(self):
+        """
+        Returns a copy of this matrix
+        """
+        return BitMatrix(self.rows, self.columns, self.words.copy(),
+                         self.order.copy())
+
+    def __len__(self):
+        """
+        Number of rows in the matrix
+        """
+        return self.rows
+
+    def get(self, row, column):
+        """
+        Returns True if bit (row, column) is set
+
+        Arguments:
+        row    -- Integer row index
+        column -- Integer column index
+        """
+        column = self.order[column]
+        word = self.words[row, column // WORD_BITS]
+        return bool((word >> numpy.uint64(column % WORD_BITS)) &
+                    numpy.uint64(1))
+
+    def set(self, row, column, value=True):
+        """
+        Sets or clears bit (row, column)
+
+        Arguments:
+        row    -- Integer row index
+        column -- Integer column index
+
+        Keyword Arguments:
+        value -- Boolean value of the bit
+        """
+        column = self.order[column]
+        bit = numpy.uint64(1) << numpy.uint64(column % WORD_BITS)
+        if value:
+            self.words[row, column // WORD_BITS] |= bit
+        else:
+            self.words[row, column // WORD_BITS] &= ~bit
+
+    def column(self, column, start=0, end=None):
+        """
+        Extracts a column of bits from rows start through end - 1
+
+        Arguments:
+        column -- Integer column index
+
+        Keyword Arguments:
+        start -- Integer first row
+        end   -- Integer row after the last row
+
+        Returns a numpy array of booleans
+        """
+        column = self.order[column]
+        words = self.words[start:end, column // WORD_BITS]
+        return ((words >> numpy.uint64(column % WORD_BITS)) &
+                numpy.uint64(1)).astype(bool)
+
+    def rows_with(self, column, start=0, end=None):
+        """
+        Returns the indexes of rows in start through end - 1 that have
+        a one in column
+
+        Arguments:
+        column -- Integer column index
+
+        Keyword Arguments:
+        start -- Integer first row
+        end   -- Integer row after the last row
+        """
+        return numpy.flatnonzero(self.column(column, start, end)) + start
+
+    def ones(self, row, start=0, end=None):
+        """
+        Returns the columns of row in start through end - 1 that are set
+
+        Arguments:
+        row -- Integer row index
+
+        Keyword Arguments:
+        start -- Integer first column
+        end   -- Integer column after the last column
+        """
+        columns = self.order[start:end]
+        shifts = (columns % WORD_BITS).astype(WORD_DTYPE)
+        bits = (self.words[row, columns // WORD_BITS] >> shifts) & \
+            numpy.uint64(1)
+        return numpy.flatnonzero(bits) + start
+
+    def mask(self, start=0, end=None):
+        """
+        Creates a row of words with ones in the physical positions of
+        logical columns start through end - 1.  Masks are used to count
+        ones within a range of columns.
+
+        Keyword Arguments:
+        start -- Integer first column
+        end   -- Integer column after the last column
+        """
+        bits = numpy.zeros(self.columns, dtype=bool)
+        bits[self.order[start:end]] = True
+        return pack(bits)
+
+    def count(self, row, mask=None):
+        """
+        Counts the ones in a row
+
+        Arguments:
+        row -- Integer row index
+
+        Keyword Arguments:
+        mask -- Optional row of words.  Only ones also in the mask count
+        """
+        words = self.words[row]
+        if mask is not None:
+            words = words & mask
+        return int(popcount(words))
+
+    def counts(self, start=0, end=None, mask=None):
+        """
+        Counts the ones in each of rows start through end - 1
+
+        Keyword Arguments:
+        start -- Integer first row
+        end   -- Integer row after the last row
+        mask  -- Optional row of words.  Only ones also in the mask count
+
+        Returns a numpy array of counts
+        """
+        words = self.words[start:end]
+        if mask is not None:
+            words = words & mask
+        return popcount(words)
+
+    def counts_of(self, rows, mask=None):
+        """
+        Counts the ones in each of the given rows
+
+        Arguments:
+        rows -- Sequence of integer row indexes
+
+        Keyword Arguments:
+        mask -- Optional row of words.  Only ones also in the mask count
+
+        Returns a numpy array of counts
+        """
+        words = self.words[rows]
+        if mask is not None:
+            words &= mask
+        return popcount(words)
+
+    def rows_touching(self, mask, start=0, end=None):
+        """
+        Returns the indexes of rows in start through end - 1 that have
+        at least one 1 in the mask.  Only words of the mask with ones
+        in them are examined
+
+        Arguments:
+        mask -- Row of words
+
+        Keyword Arguments:
+        start -- Integer first row
+        end   -- Integer row after the last row
+        """
+        used = numpy.flatnonzero(mask)
+        words = self.words[start:end, used] & mask[used]
+        return numpy.flatnonzero(words.any(axis=1)) + start
+
+    def xor_row(self, target, source):
+        """
+        XORs row source into row target
+
+        Arguments:
+        target -- Integer target row
+        source -- Integer source row
+        """
+        self.words[target] ^= self.words[source]
+
+    def xor_rows(self, targets, source):
+        """
+        XORs row source into each of the rows in targets.
+
+        Arguments:
+        targets -- Sequence of distinct integer target rows
+        source  -- Integer source row (must not be in targets)
+        """
+        self.words[targets] ^= self.words[source]
+
+    def xor_pairs(self, targets, sources):
+        """
+        XORs row sources[n] into row targets[n] for every n.  Targets may
+        repeat but no source may also be a target
+
+        Arguments:
+        targets -- Sequence of integer target rows
+        sources -- Sequence of integer source rows
+        """
+        numpy.bitwise_xor.at(self.words, targets, self.words[sources])
+
+    def exchange_rows(self, r1, r2):
+        """
+        Swaps rows r1 and r2
+
+        Arguments:
+        r1 -- Integer first row
+        r2 -- Integer second row
+        """
+        swap = self.words[r1].copy()
+        self.words[r1] = self.words[r2]
+        self.words[r2] = swap
+
+    def exchange_columns(self, c1, c2):
+        """
+        Swaps logical columns c1 and c2.  Only the column map changes
+
+        Arguments:
+        c1 -- Integer first column
+        c2 -- Integer second column
+        """
+        self.order[c1], self.order[c2] = self.order[c2], self.order[c1]
+
+
+class Basis(object):
+    """
+    Row space of a growing set of rows over GF(2) kept in reduced row
+    echelon form.  Every basis row has a pivot column that is zero in all
+    other basis rows, so a new row is reduced against the whole basis with
+    a single XOR of the basis rows at its pivot columns.
+    """
+
+    def __init__(self, columns):
+        """
+        Arguments:
+        columns -- Integer number of columns of each row
+        """
+        self.columns = columns
+        self.width = width(columns)
+        self.words = numpy.zeros((columns, self.width), dtype=WORD_DTYPE)
+        self.rank = 0
+
+        # Row of words with ones at every pivot column
+        self.pivots = numpy.zeros(self.width, dtype=WORD_DTYPE)
+
+        # Basis row holding the pivot for each column, -1 if none
+        self.slots = numpy.empty(columns, dtype='int64')
+        self.slots.fill(-1)
+
+    def reduce(self, row):
+        """
+        Reduces a row of words against the basis
+
+        Arguments:
+        row -- Row of uint64 words
+
+        Returns the reduced row of words
+        """
+        hits = numpy.flatnonzero(unpack(row & self.pivots, self.columns))
+        if not len(hits):
+            return row.copy()
+        combined = numpy.bitwise_xor.reduce(self.words[self.slots[hits]])
+        return row ^ combined
+
+    def add(self, row):
+        """
+        Adds a row to the basis if it is independent of the basis.  The
+        row is reduced by one XOR of up to rank basis rows and, when it
+        is independent, xored into the basis rows with a one in its pivot
+        column, so an add costs O(rank x width) words.  Numpy xors the
+        rows involved in one call, but the work grows with the rank
+
+        Arguments:
+        row -- Row of uint64 words
+
+        Returns True if the rank increased, False otherwise
+        """
+        row = self.reduce(row)
+        nonzero = numpy.flatnonzero(row)
+        if not len(nonzero):
+            return False
+
+        # Lowest set bit of the first non zero word is the pivot
+        word = nonzero[0]
+        value = int(row[word])
+        pivot = word * WORD_BITS + (value & -value).bit_length() - 1
+        bit = numpy.uint64(1) << numpy.uint64(pivot % WORD_BITS)
+
+        # Clear the pivot column from the rest of the basis
+        rows = numpy.flatnonzero(self.words[:self.rank, word] & bit)
+        if len(rows):
+            self.words[rows] ^= row
+
+        self.words[self.rank] = row
+        self.slots[pivot] = self.rank
+        self.pivots[word] |= bit
+        self.rank += 1
+        return True
@@ -0,0 +1,121 @@
+"""
+Copyright [2013] [James Absalon]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+class DegreeBuckets(object):
+    """
+    Keeps rows of a matrix in buckets by their current degree (number of
+    ones in matrix V) so the rows with the fewest ones can be found without
+    recounting every row.  Rows with degree 0 are tracked but never
+    returned.
+    """
+
+    def __init__(self, degrees, start=0):
+        """
+        Arguments:
+        degrees -- Sequence of integer degrees indexed by row
+
+        Keyword Arguments:
+        start -- Integer first row to place into buckets.  Rows before
+                 start are not tracked
+        """
+        self.degrees = {}
+        self.buckets = [set()]
+        self.low = 0
+        for row in xrange(start, len(degrees)):
+            self.update(row, int(degrees[row]))
+
+    def __contains__(self, row):
+        """
+        Returns True if row is being tracked
+        """
+        return row in self.degrees
+
+    def degree(self, row):
+        """
+        Returns the current degree of a tracked row
+
+        Arguments:
+        row -- Integer row index
+        """
+        return self.degrees[row]
+
+    def update(self, row, degree):
+        """
+        Sets the degree of row, moving it between buckets
+
+        Arguments:
+        row    -- Integer row index
+        degree -- Integer new degree of the row
+        """
+        old = self.degrees.get(row)
+        if old == degree:
+            return
+        if old is not None:
+            self.buckets[old].discard(row)
+
+        while degree >= len(self.buckets):
+            self.buckets.append(set())
+
+        self.degrees[row] = degree
+        self.buckets[degree].add(row)
+        if 0 < degree < self.low or not self.low:
+            self.low = degree
+
+    def remove(self, row):
+        """
+        Stops tracking row
+
+        Arguments:
+        row -- Integer row index
+        """
+        degree = self.degrees.pop(row, None)
+        if degree is not None:
+            self.buckets[degree].discard(row)
+
+    def exchange(self, r1, r2):
+        """
+        Swaps the degrees of rows r1 and r2 after the rows themselves
+        have been exchanged
+
+        Arguments:
+        r1 -- Integer first row
+        r2 -- Integer second row
+        """
+        d1 = self.degrees.get(r1)
+        d2 = self.degrees.get(r2)
+        self.remove(r1)
+        self.remove(r2)
+        if d2 is not None:
+            self.update(r1, d2)
+        if d1 is not None:
+            self.update(r2, d1)
+
+    def minimum(self):
+        """
+        Finds the smallest non zero degree and the rows with that degree
+
+        Returns tuple (degree, set of rows) or (None, empty set) when
+        every tracked row has degree 0
+        """
+        if not self.low:
+            self.low = 1
+        while self.low < len(self.buckets):
+            if self.buckets[self.low]:
+                return self.low, self.buckets[self.low]
+            self.low += 1
+        self.low = 0
+        return None, set()
@@ -0,0 +1,87 @@
+"""
+Copyright [2013] [James Absalon]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Process wide cache holding at most size entries.  The least recently
+    used entry is evicted to make room for a new one.  Cached values are
+    shared by every caller and must not be modified
+    """
+
+    def __init__(self, size):
+        """
+        Arguments:
+        size -- Integer maximum number of entries
+        """
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        """
+        Returns True if key is cached
+        """
+        return key in self.entries
+
+    def __len__(self):
+        """
+        Number of cached entries
+        """
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """
+        Looks up key, marking it as the most recently used
+
+        Arguments:
+        key -- Hashable key
+
+        Keyword Arguments:
+        default -- Value returned when key is not cached
+
+        Returns the cached value or default
+        """
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+
+    def put(self, key, value):
+        """
+        Caches value under key, evicting the least recently used entries
+        beyond size
+
+        Arguments:
+        key -- Hashable key
+        value -- Value to cache
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every entry
+        """
+        with self.lock:
+            self.entries.clear()
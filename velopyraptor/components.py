@@ -0,0 +1,203 @@
+"""
+Copyright [2013] [James Absalon]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import heapq
+
+
+class Components(object):
+    """
+    Disjoint set forest over the columns of matrix V.  Rows with exactly
+    two ones in V are edges between their two columns.  Edges are added
+    and removed as row degrees change so the connected components never
+    have to be rebuilt from scratch.
+
+    A disjoint set cannot split a component, so removing an edge only
+    marks its component dirty.  Dirty components are rebuilt from their
+    remaining edges the next time the largest component is asked for.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty forest
+        """
+        # Parent of each column, roots are their own parent
+        self.parent = {}
+
+        # Row to (column, column) for every edge
+        self.edges = {}
+
+        # Root to set of rows (edges) and set of columns in the component
+        self.rows = {}
+        self.columns = {}
+
+        # Roots whose component may have split
+        self.dirty = set()
+
+        # Heap of (-number of edges, root).  Entries go stale as
+        # components change and are checked when popped
+        self.heap = []
+
+    def __contains__(self, row):
+        """
+        Returns True if row is an edge
+        """
+        return row in self.edges
+
+    def __len__(self):
+        """
+        Number of edges
+        """
+        return len(self.edges)
+
+    def find(self, column):
+        """
+        Finds the root of the component containing column
+
+        Arguments:
+        column -- Integer column (vertex)
+
+        Returns the integer root column
+        """
+        parent = self.parent
+        if column not in parent:
+            parent[column] = column
+            self.rows[column] = set()
+            self.columns[column] = set([column])
+            return column
+
+        root = column
+        while parent[root] != root:
+            root = parent[root]
+
+        # Compress the path
+        while parent[column] != root:
+            parent[column], column = root, parent[column]
+        return root
+
+    def union(self, c1, c2):
+        """
+        Joins the components of columns c1 and c2
+
+        Arguments:
+        c1 -- Integer first column
+        c2 -- Integer second column
+
+        Returns the integer root of the joined component
+        """
+        r1 = self.find(c1)
+        r2 = self.find(c2)
+        if r1 == r2:
+            return r1
+
+        # Attach the smaller component beneath the larger
+        if len(self.columns[r1]) < len(self.columns[r2]):
+            r1, r2 = r2, r1
+        self.parent[r2] = r1
+        self.rows[r1] |= self.rows.pop(r2)
+        self.columns[r1] |= self.columns.pop(r2)
+        if r2 in self.dirty:
+            self.dirty.discard(r2)
+            self.dirty.add(r1)
+        return r1
+
+    def add(self, row, c1, c2):
+        """
+        Adds row as an edge between columns c1 and c2
+
+        Arguments:
+        row -- Integer row index
+        c1  -- Integer first column
+        c2  -- Integer second column
+        """
+        self.edges[row] = (c1, c2)
+        root = self.union(c1, c2)
+        self.rows[root].add(row)
+        heapq.heappush(self.heap, (-len(self.rows[root]), root))
+
+    def remove(self, row):
+        """
+        Removes the edge for row.  Its component is marked dirty
+
+        Arguments:
+        row -- Integer row index
+        """
+        c1, c2 = self.edges.pop(row)
+        root = self.find(c1)
+        self.rows[root].discard(row)
+        self.dirty.add(root)
+
+    def exchange(self, r1, r2):
+        """
+        Swaps the edges of rows r1 and r2 after the rows themselves have
+        been exchanged
+
+        Arguments:
+        r1 -- Integer first row
+        r2 -- Integer second row
+        """
+        if r1 == r2:
+            return
+        e1 = self.edges.get(r1)
+        e2 = self.edges.get(r2)
+        for row, edge in ((r1, e1), (r2, e2)):
+            if edge is not None:
+                del self.edges[row]
+                self.rows[self.find(edge[0])].discard(row)
+        for row, edge in ((r2, e1), (r1, e2)):
+            if edge is not None:
+                self.edges[row] = edge
+                self.rows[self.find(edge[0])].add(row)
+
+    def rebuild(self, root):
+        """
+        Splits a dirty component back into its true components using
+        the edges it still has
+
+        Arguments:
+        root -- Integer root of the dirty component
+        """
+        rows = self.rows.pop(root)
+        columns = self.columns.pop(root)
+        for column in columns:
+            self.parent[column] = column
+            self.rows[column] = set()
+            self.columns[column] = set([column])
+
+        for row in rows:
+            c1, c2 = self.edges[row]
+            new_root = self.union(c1, c2)
+            self.rows[new_root].add(row)
+
+        for column in columns:
+            if self.parent[column] == column and self.rows[column]:
+                heapq.heappush(self.heap,
+                               (-len(self.rows[column]), column))
+
+    def largest(self):
+        """
+        Returns a row from the component with the most edges or None
+        when there are no edges
+        """
+        while self.dirty:
+            self.rebuild(self.dirty.pop())
+
+        while self.heap:
+            size, root = self.heap[0]
+            rows = self.rows.get(root)
+            if self.parent.get(root) == root and rows and \
+                    len(rows) == -size:
+                return min(rows)
+            heapq.heappop(self.heap)
+        return None
@@ -13,7 +13,15 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from raptor import RaptorR10
+import numpy
+
+from bitmatrix import Basis
+from raptor import RaptorR10, RaptorR10DecodingScheduleException
+
+# Symbols beyond k first chosen to decode from, at least CHOSEN_OVERHEAD
+# and k / CHOSEN_FRACTION.  The overhead is doubled on every retry
+CHOSEN_OVERHEAD = 8
+CHOSEN_FRACTION = 16
 
 
 class Decoder(RaptorR10):
@@ -23,9 +31,18 @@ class Decoder(RaptorR10):
 
     To get the source symbols, just decoded the first k encoding
     symbols
+
+    The decoder is online.  Each appended symbol's row of matrix A is
+    reduced against the rows already received so decodability is known
+    as soon as A reaches rank l without building a decoding schedule.
+    Each append costs O(rank x width) words, see Basis.add.  The basis
+    is only a rank check.  Its dense elimination is not reused by
+    decode, which builds the decoding schedule from A as the encoder
+    does, as that schedule takes far fewer symbol XORs.  Only the packed
+    LT rows are kept between appends, so decode does not recompute them.
     """
 
-    def __init__(self, k, symbols=None):
+    def __init__(self, k, symbols=None, **kwargs):
         """
         Arguments:
         block -- Block with set k and symbol size.  Each of the block's
@@ -36,25 +53,229 @@ class Decoder(RaptorR10):
                    decoder with.
         """
         # Use parent class to gen parameters
-        super(Decoder, self).__init__(k)
+        super(Decoder, self).__init__(k, **kwargs)
         if symbols is None:
             symbols = []
         self.symbols = symbols
 
+        # The basis is created with the first symbol
+        self.basis = None
+
+        # Packed lt rows of the symbols reduced so far
+        self.received = []
+        if self.symbols:
+            self.sync()
+
+    def sync(self):
+        """
+        Reduces the rows of any symbols not yet seen against the rows
+        already received
+        """
+        if self.basis is None:
+            # The precode rows are always part of A
+            self.basis = Basis(self.l)
+            for row in self.precode_rows():
+                self.basis.add(row)
+
+        esis = [esi for esi, symbol in self.symbols[len(self.received):]]
+        for row in self.lt_words(esis):
+            self.received.append(row)
+            self.basis.add(row)
+
     def append(self, symbol_tuple):
         """
         Appends another symbol to the decoder.
 
         Argument:
         symbol_tuple -- Should be a 2 tuple (Integer id, Bitarray symbol)
+
+        Returns True if decoding is now possible
         """
         self.symbols.append(symbol_tuple)
         return self.can_decode()
 
+    def can_decode(self):
+        """
+        Determines whether or not decoding can take place.  Decoding is
+        possible once every source symbol is received or the received
+        rows bring A to rank l
+
+        Returns true for success, false otherwise
+        """
+        if self.has_all_sources():
+            return True
+        self.sync()
+        return self.basis.rank == self.l
+
+    def lt_rows(self):
+        """
+        Returns the lt rows of the received symbols
+        """
+        self.sync()
+        if not self.received:
+            return super(Decoder, self).lt_rows()
+        return numpy.array(self.received)
+
     def decode(self):
         """
         Nice way of saying decode the intermediate symbols
         Difference between the encoder and the decoder
         is that you choose when to decode with the decoder
+
+        Nothing is decoded when every source symbol was received.  Source
+        symbols received are always passed through by next, so only the
+        missing ones are encoded from the intermediate symbols.  Only the
+        symbols chosen by choose are decoded from, in its order.  The
+        schedule is built from A, not from the basis, see the class
+        docstring
+        """
+        if self.has_all_sources():
+            return
+        self.check_rank()
+        self.with_chosen(super(Decoder, self).calculate_i_symbols)
+
+    def preferred(self, esis):
+        """
+        Orders ids by how cheap their symbols are to decode from.  Source
+        symbols come first, then repair symbols by increasing LT degree.
+        Repeated ids are dropped
+
+        Arguments:
+        esis -- Sequence of integer ids
+
+        Returns a list of integer ids
+        """
+        esis = sorted(set(esis))
+        degrees = self.triples(esis)[0].tolist()
+        order = sorted(xrange(len(esis)),
+                       key=lambda n: (esis[n] >= self.k, degrees[n], n))
+        return [esis[n] for n in order]
+
+    def choose(self, overhead):
+        """
+        Chooses the symbols to decode from and the order of their rows in
+        A.  Repeated ids are dropped as their rows only add XORs.  Of the
+        others the k + overhead cheapest are chosen, source symbols first
+        and then repair symbols by increasing LT degree, so A has fewer
+        and lighter rows and ties in phase 1 go to the lightest rows.
+        The symbols left over are kept in reserve, see with_chosen
+
+        Arguments:
+        overhead -- Integer number of symbols chosen beyond k
+
+        Returns a list of indexes of the chosen symbols
+        """
+        first = {}
+        for n, (esi, symbol) in enumerate(self.symbols):
+            first.setdefault(esi, n)
+        preferred = self.preferred(first.keys())
+        return [first[esi] for esi in preferred[:self.k + overhead]]
+
+    def with_chosen(self, function):
+        """
+        Calls function with only the chosen symbols in place of the
+        symbols.  The chosen symbols may not bring A to rank l even when
+        all of them do.  When function raises a
+        RaptorR10DecodingScheduleException, the overhead is doubled with
+        symbols from the reserve and function is called again, until
+        every symbol is used.  Stats record the symbols chosen, repeated
+        and left in reserve and the number of retries
+
+        Arguments:
+        function -- Function taking no arguments
+
+        Returns what function returns
+        """
+        self.sync()
+        symbols, received = self.symbols, self.received
+        unique = len(set(esi for esi, symbol in symbols))
+        overhead = max(CHOSEN_OVERHEAD, self.k // CHOSEN_FRACTION)
+        retries = 0
+        while True:
+            chosen = self.choose(overhead)
+            self.symbols = [symbols[n] for n in chosen]
+            self.received = [received[n] for n in chosen]
+            try:
+                result = function()
+                break
+            except RaptorR10DecodingScheduleException:
+                if len(chosen) == unique:
+                    raise
+                overhead *= 2
+                retries += 1
+            finally:
+                self.symbols, self.received = symbols, received
+        self.stats['chosen_symbols'] = len(chosen)
+        self.stats['repeated_symbols'] = len(symbols) - unique
+        self.stats['reserve_symbols'] = unique - len(chosen)
+        self.stats['choose_retries'] = retries
+        return result
+
+    def check_rank(self):
+        """
+        Raises a RaptorR10DecodingScheduleException unless decoding can
+        take place
+        """
+        if not self.can_decode():
+            raise RaptorR10DecodingScheduleException(
+                "Matrix A has rank %s of %s. More symbols are needed." %
+                (self.basis.rank, self.l)
+            )
+
+    def decode_symbols(self, esis):
         """
-        super(Decoder, self).calculate_i_symbols()
+        Decodes only the symbols esis instead of every intermediate
+        symbol.  The schedule is walked back from the rows of D holding
+        the intermediate symbols those ids are encoded from, and only the
+        XORs they depend on are applied to only the symbols they read.
+        Received source symbols are passed through and once the
+        intermediate symbols are decoded they are simply encoded
+
+        Arguments:
+        esis -- Sequence of integer ids of the symbols to decode
+
+        Returns a 2D numpy array of decoded symbols, one row per id
+        """
+        sources = self.source_symbols()
+        missing = [esi for esi in esis if esi not in sources]
+        if not missing or self.i_symbols is not None:
+            return self.generate(esis)
+        self.check_rank()
+        return self.with_chosen(lambda: self.decode_sliced(esis, sources))
+
+    def decode_sliced(self, esis, sources):
+        """
+        Decodes the symbols esis through a slice of the schedule, see
+        decode_symbols
+
+        Arguments:
+        esis -- Sequence of integer ids of the symbols to decode
+        sources -- Dictionary of integer id to received source symbol
+
+        Returns a 2D numpy array of decoded symbols, one row per id
+        """
+        missing = [esi for esi in esis if esi not in sources]
+        schedule = self.compile_schedule()
+        arrays = dict(zip(missing, self.neighbor_arrays(missing)))
+
+        # Row of D holding each intermediate symbol after the schedule
+        rows = numpy.empty(self.l, dtype='int64')
+        rows[schedule.c] = schedule.d[:self.l]
+        needed = rows[numpy.unique(numpy.concatenate(arrays.values()))]
+        sliced = schedule.slice(needed.tolist())
+        self.stats['sliced_xors'] = len(sliced.xors)
+
+        read = set(needed.tolist())
+        for source, target in sliced.xors:
+            read.add(source)
+            read.add(target)
+        D = self.calculate_d(schedule.temps, read)
+        self.apply_schedule(D, sliced)
+
+        out = numpy.empty((len(esis), D.shape[1]), dtype=D.dtype)
+        for n, esi in enumerate(esis):
+            if esi in sources:
+                out[n] = sources[esi]
+            else:
+                self.xor_fused(D, rows[arrays[esi]], out[n])
+        return out
@@ -14,6 +14,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import numpy
+
 # Implemented based on http://tools.ietf.org/html/rfc5053#section-5.4.4.4
 # Maps a range of numbers to degrees (not temperature. actually, not sure
 # what it means
@@ -41,3 +43,18 @@ def R10(v):
             return D[i]
 
     raise Exception("Degree not found for v %s" % v)
+
+
+def R10_array(v):
+    """
+    Returns the R10 degrees for a numpy array of v at once.  The range
+    holding each v is found by binary search over F
+    """
+    v = numpy.asarray(v, dtype='int64')
+    if len(v) and (v.min() < V_MIN or v.max() >= V_MAX):
+        raise Exception(
+            "Recieved v outside of %s and %s" % (V_MIN, V_MAX)
+        )
+    return numpy.array(D[1:], dtype='int64')[
+        numpy.searchsorted(F, v, side='right') - 1
+    ]
@@ -17,6 +17,8 @@ limitations under the License.
 import math
 import operator
 
+import numpy
+
 V0_R10 = [
     251291136, 3952231631, 3370958628, 4070167936, 123631495, 3351110283,
     3218676425, 2011642291, 774603218, 2402805061, 1004366930,
@@ -126,3 +128,21 @@ def R10(X, i, m):
     v0 = V0_R10[int((X + i) % 256)]
     v1 = V1_R10[int((math.floor(X/256) + i) % 256)]
     return operator.xor(v0, v1) % m
+
+
+# The tables as numpy arrays for R10_array
+V0_ARRAY = numpy.array(V0_R10, dtype='int64')
+V1_ARRAY = numpy.array(V1_R10, dtype='int64')
+
+
+def R10_array(X, i, m):
+    """
+    Generates R10 pseudo random numbers for a numpy array of X at once.
+    Matches R10 for every element
+
+    Returns a numpy array of int64
+    """
+    X = numpy.asarray(X, dtype='int64')
+    v0 = V0_ARRAY[(X + i) % 256]
+    v1 = V1_ARRAY[(X // 256 + i) % 256]
+    return (v0 ^ v1) % m
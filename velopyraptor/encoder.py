@@ -13,6 +13,8 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import numpy
+
 import matrix
 from raptor import RaptorR10
 
@@ -36,6 +38,61 @@ class Encoder(RaptorR10):
         self.calculate_i_symbols()
 
 
+class BatchEncoder(Encoder):
+    """
+    Encodes several blocks of the same k at once.  Every block is
+    encoded from source ids 0 to k - 1 so they share one decoding
+    schedule.  Symbol j of every block is laid end to end in row j of
+    the stacked symbols, so each XOR of the schedule, and of encoding,
+    is applied to every block in a single operation
+    """
+
+    def __init__(self, k, blocks, **kwargs):
+        """
+        Arguments:
+        k      -- Integer number of source symbols
+        blocks -- 3D numpy array (block x symbol x words), or a list of
+                  blocks of k equal sized symbols
+        """
+        blocks = numpy.asarray(blocks)
+        if blocks.ndim != 3 or blocks.shape[1] != k:
+            raise Exception("Blocks of shape %s are not blocks of %s "
+                            "symbols" % (blocks.shape, k))
+        self.blocks, self.width = blocks.shape[0], blocks.shape[2]
+
+        stacked = numpy.ascontiguousarray(blocks.transpose(1, 0, 2))
+        stacked = stacked.reshape(k, self.blocks * self.width)
+        super(BatchEncoder, self).__init__(k, list(enumerate(stacked)),
+                                           **kwargs)
+
+    def unstack(self, symbols):
+        """
+        Views stacked symbols block by block
+
+        Arguments:
+        symbols -- 2D numpy array of stacked symbols, one row per id
+
+        Returns a 3D numpy array view (block x id x words)
+        """
+        return symbols.reshape(len(symbols), self.blocks,
+                               self.width).transpose(1, 0, 2)
+
+    def generate_blocks(self, esis, out=None):
+        """
+        Encodes a batch of symbols of every block at once, see generate
+
+        Arguments:
+        esis -- Sequence of integer ids of the symbols to encode
+
+        Keyword Arguments:
+        out -- 2D numpy array of stacked symbols with a row per id to
+            fill.  None to allocate one
+
+        Returns a 3D numpy array view (block x id x words) of out
+        """
+        return self.unstack(self.generate(esis, out=out))
+
+
 class EncoderHard(RaptorR10):
     """
     The same as the Encoder except for the option to
@@ -65,7 +122,12 @@ class EncoderHard(RaptorR10):
 
         Returns list of bit arrays representing intermediate symbols
         """
-        a = self.a()
+        a = self.a().tobitarrays()
         ai = matrix.inverse(a)
         d = self.calculate_d()
-        return matrix.multiply(ai, d)
+
+        # Bits of each word of D from the lowest, for words of any width
+        shifts = numpy.arange(d.dtype.itemsize * 8).astype(d.dtype)
+        bits = (d[:, :, numpy.newaxis] >> shifts) & d.dtype.type(1)
+        bits = bits.reshape(len(d), -1).astype(bool)
+        return matrix.multiply(ai, matrix.from_bool(bits))
@@ -143,7 +143,16 @@ class FileDecoder(object):
             decoder = Decoder(k)
             read_symbols = 0
 
-            for _file in os.listdir(blockdir):
+            # Share files by id, as named.  Names need not be canonical
+            files = {}
+            for f in sorted(os.listdir(blockdir)):
+                if f.isdigit():
+                    files.setdefault(int(f), f)
+
+            # Source symbols are read first as they need no decoding, then
+            # the repair symbols of least degree
+            esis = decoder.preferred(files.keys())
+            for _file in [files[esi] for esi in esis]:
                 # Skip non files
                 if not os.path.isfile(os.path.join(blockdir, _file)):
                     continue
@@ -185,6 +194,7 @@ class FileDecoder(object):
             # Steam source symbol output by encoding the first
             # k encoded symbols.
             # The first k source symbols == the first k encoding symbols
+            # Source symbols read are passed through untouched
             target = open(self.output_file, 'ab')
             for i in xrange(k):
 
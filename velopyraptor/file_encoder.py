@@ -16,7 +16,10 @@ limitations under the License.
 
 import os
 import time
-from encoder import Encoder
+
+import numpy
+
+from encoder import BatchEncoder
 from chunker import FileChunker
 
 
@@ -28,7 +31,8 @@ class FileEncoder(object):
     out the shares
     """
 
-    def __init__(self, k, s, m, input_file, output_dir, optimal=False):
+    def __init__(self, k, s, m, input_file, output_dir, optimal=False,
+                 workers=1, stripe_size=None, batch=1):
         """
         Initializes an instance of a file encoder
 
@@ -38,6 +42,12 @@ class FileEncoder(object):
         m          -- Intger number of parity symbols
         input_file -- File to encode
         output_dir -- Directory to place encoded blocks and shares
+
+        Keyword Arguments
+        optimal     -- Boolean use optimal symbols when encoding
+        workers     -- Integer number of threads encoding each symbol
+        stripe_size -- Integer bytes of each symbol per thread task
+        batch       -- Integer number of blocks encoded together
         """
         self.k = k
         self.s = s  # Bytes
@@ -49,6 +59,9 @@ class FileEncoder(object):
             'encoding_time': 0
         }
         self.optimal = optimal
+        self.workers = workers
+        self.stripe_size = stripe_size
+        self.batch = max(1, batch)
         self.t = None
 
     def start_timer(self):
@@ -104,10 +117,27 @@ class FileEncoder(object):
         except:
             self.exit("Unable to create directory %s." % self.output_dir)
 
+    def chunk(self, chunker):
+        """
+        Reads the next batch of blocks
+
+        Arguments:
+        chunker -- FileChunker of the input file
+
+        Returns a list of up to batch blocks, empty at the end of the file
+        """
+        blocks = []
+        while len(blocks) < self.batch:
+            block = chunker.chunk()
+            if not block:
+                break
+            blocks.append(block)
+        return blocks
+
     def encode(self):
         """
-        Creates a file chunker and iterates over each chunk decoding a chunk
-        at a time to reduce memory costs
+        Creates a file chunker and iterates over batches of chunks encoding
+        a batch at a time to reduce memory costs
         """
 
         self.stats['start_time'] = time.time()
@@ -120,48 +150,57 @@ class FileEncoder(object):
 
             # Chunker returns none when we are out of blocks
             self.start_timer()
-            block = chunker.chunk()
+            blocks = self.chunk(chunker)
             self.add_time(self.stop_timer(), 'chunking_time')
-            while(block):
-
-                # Create the block directory
-                dir_name = os.path.join(self.output_dir, str(block_name))
-                os.makedirs(dir_name)
-
-                # The k source symbols are the first k encoding symbols
-                # The id is used to calculate a triple
-                source_symbols = [(id, block[id]) for id in xrange(self.k)]
+            symbols = None
+            while(blocks):
 
+                # The k source symbols of every block are the first k
+                # encoding symbols so one schedule encodes the whole batch
                 self.start_timer()
-                encoder = Encoder(self.k, source_symbols,
-                                  use_optimal_esis=self.optimal)
+                encoder = BatchEncoder(self.k, blocks,
+                                       use_optimal_esis=self.optimal,
+                                       workers=self.workers,
+                                       stripe_size=self.stripe_size)
                 self.add_time(self.stop_timer(), 'encoding_time')
 
-                # Write padding and k parameters that will be used
-                # to decode the block
-                # @TODO - Pack integers into bytes and write to binary file
-                #   Instead of text
-                f = open(os.path.join(dir_name, 'meta'), 'w')
-                f.write("%s:%s" % (block.k, block.padding))
-                f.close()
-
-                # Iterate over the encoder and produce the first k + m symbols
+                # Produce the first k + m symbols of every block in one
+                # batch into a buffer reused by every batch of the same size
                 # In this instance the first k symbols will match the source
                 # symbols
                 # m is the number of parity blocks
                 # NOTE - We could start at k and produce k+m symbols consisting
                 # entirely of parity blocks and be just as fine
-                for esi in xrange(self.k + self.m):
-                    # The encoder produces an (id, numpy array) tuple
-                    self.start_timer()
-                    esi, symbol = encoder.next()
-                    self.add_time(self.stop_timer(), 'encoding_time')
-                    symbol.tofile(os.path.join(dir_name, str(esi)))
+                self.start_timer()
+                esis = encoder.next_ids(self.k + self.m)
+                shape = (len(esis), encoder.i_symbols.shape[1])
+                if symbols is None or symbols.shape != shape:
+                    symbols = numpy.empty(shape,
+                                          dtype=encoder.i_symbols.dtype)
+                encoded = encoder.generate_blocks(esis, out=symbols)
+                self.add_time(self.stop_timer(), 'encoding_time')
+
+                for block, block_symbols in zip(blocks, encoded):
+
+                    # Create the block directory
+                    dir_name = os.path.join(self.output_dir, str(block_name))
+                    os.makedirs(dir_name)
+
+                    # Write padding and k parameters that will be used
+                    # to decode the block
+                    # @TODO - Pack integers into bytes and write to binary
+                    #   file Instead of text
+                    f = open(os.path.join(dir_name, 'meta'), 'w')
+                    f.write("%s:%s" % (block.k, block.padding))
                     f.close()
 
-                block_name += 1
+                    for esi, symbol in zip(esis, block_symbols):
+                        symbol.tofile(os.path.join(dir_name, str(esi)))
+
+                    block_name += 1
+
                 self.start_timer()
-                block = chunker.chunk()
+                blocks = self.chunk(chunker)
                 self.add_time(self.stop_timer(), 'chunking_time')
 
         self.stats['blocksize'] = self.k * self.s
@@ -191,10 +230,19 @@ if __name__ == '__main__':
                         help="Symbol size in bytes(default 1 * 1024 * 1024)")
     parser.add_argument('-o', '--o', default=False, action="store_true",
                         help="Use optimal symbols when encoding.")
+    parser.add_argument('--workers', default=1, type=int,
+                        help="Number of threads encoding.(default 1)")
+    parser.add_argument('--stripe', default=None, type=int,
+                        help="Bytes of each symbol per thread task."
+                        "(default symbolsize / workers)")
+    parser.add_argument('--batch', default=1, type=int,
+                        help="Number of blocks encoded together.(default 1)")
 
     args = parser.parse_args()
     encoder = FileEncoder(args.k, args.s, args.m, args.file,
-                          args.directory, optimal=args.o)
+                          args.directory, optimal=args.o,
+                          workers=args.workers, stripe_size=args.stripe,
+                          batch=args.batch)
     encoder.encode()
 
     print "Finished encoding %s into directory %s" \
@@ -14,13 +14,20 @@ See the License for the specific language governing permissions and
 limitations under the License.
 
 The methods contained within this module are designed to facilitate
-matrix operations over GF(2).  I did consider numpy, but I believe
-numpy to use 8 bit booleans.  When our symbol sizes easily exceed 10 MB
-it makes sense to use bitarrays which fit 8 booleans into one byte.
+matrix operations over GF(2).  Matrices are passed in and out as lists of
+bitarrays, which fit 8 booleans into one byte.  The work is done on the
+rows packed into 64 bit words, see bitmatrix, so numpy XORs a whole row
+at a time instead of python walking single bits.
 """
-import copy
+import numpy
 from bitarray import bitarray
 
+import bitmatrix
+from bitmatrix import BitMatrix
+
+# Widest block of columns multiply tabulates the combinations of
+BLOCK = 8
+
 
 def zeros(n, m):
     """
@@ -53,15 +60,79 @@ def identity(n):
     return matrix
 
 
+def to_bool(a):
+    """
+    Converts a matrix to booleans
+
+    Arguments:
+    a -- List of equal length bitarrays
+
+    Returns a 2D numpy array of booleans
+    """
+    return BitMatrix.from_bitarrays(a).tobool()
+
+
+def from_bool(bits):
+    """
+    Converts booleans to a matrix
+
+    Arguments:
+    bits -- 2D numpy array of booleans
+
+    Returns a list of bitarrays
+    """
+    rows, columns = bits.shape
+    return BitMatrix(rows, columns, bitmatrix.pack(bits)).tobitarrays()
+
+
+def bit(words, column):
+    """
+    Extracts a column of packed rows
+
+    Arguments:
+    words -- Numpy array of rows of uint64 words, any number of leading
+             axes
+    column -- Integer column
+
+    Returns a numpy array of booleans with the leading axes of words
+    """
+    mask = numpy.uint64(1) << numpy.uint64(column % bitmatrix.WORD_BITS)
+    return (words[..., column // bitmatrix.WORD_BITS] & mask) != 0
+
+
+def eliminate(words, columns):
+    """
+    Gauss-Jordan elimination of packed rows in place.  Rows are not
+    exchanged.  For each of the first columns columns the first row with
+    a one that is not yet a pivot becomes the column's pivot and is xored
+    into every other row with a one in the column
+
+    Arguments:
+    words -- 2D numpy array of rows of uint64 words
+    columns -- Integer number of columns to eliminate
+
+    Returns a list of tuples (integer pivot row, integer column)
+    """
+    pivots = []
+    unused = numpy.ones(len(words), dtype=bool)
+    for column in xrange(columns):
+        ones = bit(words, column)
+        row = int((ones & unused).argmax())
+        if not (ones[row] and unused[row]):
+            continue
+        unused[row] = False
+        ones[row] = False
+        words[ones] ^= words[row]
+        pivots.append((row, column))
+    return pivots
+
+
 def inverse(a):
     """
     Calculates the inverse of a (n x n)matrix over GF(2)
-    The n x n identity matrix is adjoined to a and then gaussian elimination
-    is performed to produce first an upper triangular matrix.
-    Gaussian elimination is further used to produce an nxn identity matrix
-    over the side that was originally a.  The right should is then the inverse
-
-    @TODO - Add check for invertible matrices
+    The n x n identity matrix is adjoined to a and then Gauss-Jordan
+    elimination is performed on the packed rows to reduce the side that
+    was originally a to the identity.  The right side is then the inverse
 
     Arguments:
     a - n array of n sized bitarray
@@ -72,50 +143,41 @@ def inverse(a):
         raise Exception("Tried to invert a %s by %s matrix. "
                         "Matrix must be square" % (size, len(a[0])))
 
-    # We dont want to change a
-    a = copy.deepcopy(a)
-
-    id = identity(size)
-    for i in xrange(size):
-        a[i] += id[i]
-
-    # First produce the upper triangular matrix (1's in the diangonal
-    # and 0's below
-    for i in xrange(size):
-
-        # First swap row i for a lower low if a[i][i] is not 1
-        if not a[i][i]:
-            # Look for rows BENEATH row i
-            for j in xrange(i + 1, size):
-                if a[j][i]:
-                    temp = a[i]
-                    a[i] = a[j]
-                    a[j] = temp
-                    break
-
-        # XOR row i to all rows > i where a[i][j] = 1
-        for j in xrange(i + 1, size):
-            if a[j][i]:
-                a[j] ^= a[i]
-
-    # We should have 1s for the diagonal and all 0s
-    for i in xrange(size):
-        if not a[i][i]:
-            raise Exception("Tried to invert invertible matrix. Matrix does "
-                            "not have ones in diagonal in upper triangular "
-                            "form")
-
-    # start at bottom right and XOR rows to rows above
-    # to get rid of 1's
-    for i in xrange(size):
-        for j in xrange(i + 1, size):
-            if a[size - j - 1][size - i - 1]:
-                a[size - j - 1] ^= a[size - i - 1]
-
-    # Git rid of original a(now a diagonal) and return the right side
-    for i in xrange(size):
-        a[i] = a[i][size:]
-    return a
+    return solve(a, identity(size))
+
+
+def solve(a, b):
+    """
+    Solves a * x = b over GF(2).  a may have more rows than columns so
+    long as it has full column rank and b is consistent with it
+
+    Arguments:
+    a -- m sized array of n sized bitarrays
+    b -- m sized array of y sized bitarrays
+
+    Returns an n sized array of y sized bitarrays
+    """
+    m = len(a)
+    n = len(a[0])
+    if not (m == len(b)):
+        raise Exception("Attempted to solve %s by %s matrix a with %s by %s "
+                        "matrix b" % (m, n, len(b), len(b[0])))
+
+    bits = numpy.hstack((to_bool(a), to_bool(b)))
+    words = bitmatrix.pack(bits)
+    pivots = eliminate(words, n)
+    if len(pivots) < n:
+        raise Exception("Matrix a has rank %s of %s and cannot be "
+                        "inverted" % (len(pivots), n))
+
+    # Pivots come in column order, rows left over must have reduced to 0
+    solution = bitmatrix.unpack(words, n + len(b[0]))[:, n:]
+    rows = [row for row, column in pivots]
+    unused = numpy.ones(m, dtype=bool)
+    unused[rows] = False
+    if solution[unused].any():
+        raise Exception("Tried to solve an inconsistent system")
+    return from_bool(solution[rows])
 
 
 def multiply(a, b):
@@ -123,6 +185,11 @@ def multiply(a, b):
     Multiplies (x by n) matrix a by (n by y) matrix b over GF(2)
     Will produce a (x by y) matrix
 
+    Rows of b are taken a block at a time in the manner of the Method of
+    Four Russians.  Every combination of a block's rows is tabulated with
+    one XOR and each row of the result xors in the combination its bits
+    of a select
+
     Arguments:
     a -- x sized array of n sized bitarrays
     b -- n sized array of y bitarrays
@@ -135,17 +202,32 @@ def multiply(a, b):
         raise Exception("Attempted to multiply %s by %s matrix a by %s by %s "
                         "matrix b" % (x, n, len(b), y))
 
-    # Init matrix
-    matrix = []
+    bits = to_bool(a)
+    words = BitMatrix.from_bitarrays(b).words
+    result = numpy.zeros((x, words.shape[1]), dtype=bitmatrix.WORD_DTYPE)
+
+    # Blocks of about log2(x) rows balance tabulating against looking up
+    block = max(1, min(BLOCK, x.bit_length() - 1, n))
+    table = numpy.zeros((1 << block, words.shape[1]),
+                        dtype=bitmatrix.WORD_DTYPE)
+    weights = 1 << numpy.arange(block, dtype='int64')
+    for start in xrange(0, n, block):
+        rows = words[start:start + block]
+        for j, row in enumerate(rows):
+            numpy.bitwise_xor(table[:1 << j], row, out=table[1 << j:2 << j])
+        result ^= table[bits[:, start:start + block].dot(
+            weights[:len(rows)])]
+    return BitMatrix(x, y, result).tobitarrays()
+
+
+def transpose(a):
+    """
+    Transposes (x by y) matrix a into a (y by x) matrix
 
-    for i in xrange(x):
-        row = bitarray(y)
-        row.setall(False)
-        for j in xrange(y):
-            for k in xrange(n):
-                row[j] ^= a[i][k] & b[k][j]
-        matrix.append(row)
-    return matrix
+    Arguments:
+    a -- x sized array of y sized bitarrays
+    """
+    return from_bool(to_bool(a).T)
 
 
 def rank(a):
@@ -155,35 +237,46 @@ def rank(a):
     Arguments:
     a -- List of even length bitarrays
     """
+    return ranks([a])[0]
 
-    m = copy.deepcopy(a)
-    rows = len(m)
-
-    for i in xrange(rows):
-
-        # Swap a row with a one into position i, i
-        if not m[i][i]:
-            for j in xrange(i + 1, rows):
-                if m[j][i]:
-                    m[i] ^= m[j]
-                    m[j] ^= m[i]
-                    m[i] ^= m[j]
-                    break
-
-        # loop down xoring all rows beneath the pivot
-        for j in xrange(i + 1, rows):
-            if m[j][i]:
-                m[j] ^= m[i]
-
-    # Look and xor duplicate rows
-    for i in xrange(rows):
-        for j in xrange(i + 1, rows):
-            if m[i] == m[j]:
-                m[j] ^= m[i]
-
-    # count th enumber of non zero rows
-    rank = 0
-    for row in m:
-        if row.count():
-            rank += 1
-    return rank
+
+def ranks(matrices):
+    """
+    Determines the ranks of a batch of bit matrices of the same size at
+    once.  Every matrix is eliminated a column at a time together with
+    the others.  Rows are not exchanged, a row that became the pivot of a
+    column is marked used and xored into every other row of its matrix
+    with a one in the column
+
+    Arguments:
+    matrices -- List of matrices, each a list of equal length bitarrays
+
+    Returns a list of integer ranks
+    """
+    if not len(matrices):
+        return []
+    words = numpy.array([BitMatrix.from_bitarrays(a).words
+                         for a in matrices])
+    if not words.size:
+        return [0] * len(matrices)
+
+    batch, rows = words.shape[:2]
+    columns = len(matrices[0][0])
+    used = numpy.zeros((batch, rows), dtype=bool)
+    everything = ~numpy.uint64(0)
+    for column in xrange(columns):
+        ones = bit(words, column)
+        found = ones & ~used
+        have = numpy.flatnonzero(found.any(axis=1))
+        if not len(have):
+            continue
+        pivots = found[have].argmax(axis=1)
+        used[have, pivots] = True
+
+        # Every other row with a one takes the pivot row
+        targets = ones[have]
+        targets[numpy.arange(len(have)), pivots] = False
+        pivot_rows = words[have, pivots]
+        masks = targets.astype(bitmatrix.WORD_DTYPE) * everything
+        words[have] ^= masks[:, :, None] & pivot_rows[:, None, :]
+    return used.sum(axis=1).tolist()
@@ -0,0 +1,100 @@
+"""
+Copyright [2013] [James Absalon]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+
+import numpy
+
+from pivoting import STRATEGIES
+from raptor import RaptorR10, RaptorR10DecodingScheduleException
+
+
+def evaluate(k, pivoting, loss=0.0, overhead=5, seed=0, **kwargs):
+    """
+    Builds the decoding schedule of a block with a pivot strategy and
+    counts its cost.  No symbol is xored, the schedule only depends on
+    the ids of the symbols
+
+    Arguments:
+    k -- Integer number of source symbols
+    pivoting -- Pivoting choosing the pivots of phase 1
+
+    Keyword Arguments:
+    loss -- Float fraction of the source symbols lost and replaced by
+        repair symbols.  0 encodes the block
+    overhead -- Integer repair symbols received beyond those lost, when
+        any are lost
+    seed -- Integer seed choosing the source symbols lost
+    Any other keyword arguments are passed to RaptorR10
+
+    Returns a dictionary with the number of columns inactivated, the
+    XORs of the schedule, the XORs left after optimizing it and the
+    seconds taken to build it
+    """
+    lost = int(k * loss)
+    esis = range(k)
+    if lost:
+        kept = numpy.random.RandomState(seed).permutation(k)[lost:]
+        esis = sorted(kept.tolist()) + range(k, k + lost + overhead)
+
+    raptor = RaptorR10(k, pivoting=pivoting, **kwargs)
+    raptor.symbols = [(esi, numpy.zeros(1, dtype='uint64')) for esi in esis]
+    start = time.time()
+    schedule = raptor.decoding_schedule(raptor.a())
+    elapsed = time.time() - start
+    xors = len(schedule.xors)
+    schedule.optimize(raptor.max_temps)
+    return {"inactivated": raptor.stats["inactivated"], "xors": xors,
+            "applied": len(schedule.xors), "time": elapsed}
+
+
+if __name__ == '__main__':
+    import argparse
+    description = "Compares the pivot strategies of phase 1 by schedule XORs"
+    parser = argparse.ArgumentParser(prog="python pivot_evaluation.py",
+                                     description=description)
+    parser.add_argument('k', nargs='*', type=int,
+                        default=[10, 100, 500, 1000, 2000, 4096, 8192],
+                        help="Numbers of source symbols to evaluate")
+    parser.add_argument('--loss', default=0.0, type=float,
+                        help="Fraction of source symbols lost.(default 0)")
+    parser.add_argument('--overhead', default=5, type=int,
+                        help="Extra repair symbols when any are lost."
+                        "(default 5)")
+    parser.add_argument('--seed', default=0, type=int,
+                        help="Seed choosing the symbols lost.(default 0)")
+    parser.add_argument('--hdpc', default=False, action="store_true",
+                        help="Leave the hdpc rows out of phase 1.")
+    parser.add_argument('--strategy', action='append',
+                        choices=sorted(STRATEGIES),
+                        help="Strategy to evaluate, may be repeated."
+                        "(default all)")
+    args = parser.parse_args()
+
+    names = args.strategy or sorted(STRATEGIES)
+    print "%6s %-14s %11s %8s %8s %8s" % \
+        ("k", "strategy", "inactivated", "xors", "applied", "time")
+    for k in args.k:
+        for name in names:
+            try:
+                result = evaluate(k, STRATEGIES[name](), loss=args.loss,
+                                  overhead=args.overhead, seed=args.seed,
+                                  use_hdpc_inactivation=args.hdpc)
+            except RaptorR10DecodingScheduleException:
+                print "%6s %-14s A is rank deficient" % (k, name)
+                continue
+            print "%6s %-14s %11s %8s %8s %8.2f" % \
+                (k, name, result["inactivated"], result["xors"],
+                 result["applied"], result["time"])
@@ -0,0 +1,169 @@
+"""
+Copyright [2013] [James Absalon]
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import heapq
+
+import numpy
+
+from bitmatrix import WORD_BITS, WORD_DTYPE
+
+# Rows of least original degree compared by strategies counting columns
+CANDIDATES = 8
+
+
+class Pivoting(object):
+    """
+    Chooses the pivot of each step of phase 1 of the decoding schedule.
+    The pivot row leaves V with a one on the diagonal in the pivot
+    column and its other ones in V are inactivated, moving their columns
+    into U.  Fewer inactivated columns leave a smaller dense U to
+    eliminate and fewer XORs to apply to the symbols.
+
+    This is the rule of RFC 5053.  Rows with the fewest ones in V are
+    chosen from, from the largest component of the graph when they have
+    two and by least original degree otherwise.  The pivot column is the
+    first column of V when the row has a one there.  Subclasses change
+    the rule by overriding choose.
+    """
+
+    name = "rfc5053"
+
+    def choose(self, raptor, a, buckets, components, o_degrees, i, u):
+        """
+        Chooses the pivot of step i of phase 1
+
+        Arguments:
+        raptor     -- RaptorR10 building the schedule
+        a          -- BitMatrix representing matrix A
+        buckets    -- DegreeBuckets holding the number of ones in V per row
+        components -- Components tracking the rows with two ones in V
+        o_degrees  -- List of original row degrees
+        i          -- Integer representing i'th iteration of reducing V
+        u          -- Integer representing number of columns in U
+
+        Returns a tuple (integer row, integer column of one of the row's
+        ones in V)
+        """
+        r, rows = raptor.rows_with_min_r(buckets)
+        if r == 2:
+            row = raptor.row_from_graph(components)
+        else:
+            row = raptor.min_degree_row(a, o_degrees, len(a), i, u, rows)
+        ones = set(a.ones(row, i, raptor.l - u).tolist())
+        if i in ones:
+            return row, i
+        return row, ones.pop()
+
+    def candidates(self, rows, o_degrees):
+        """
+        Returns the CANDIDATES rows of least original degree, in order
+
+        Arguments:
+        rows      -- Iterable of integer rows
+        o_degrees -- List of original row degrees
+        """
+        return heapq.nsmallest(CANDIDATES, rows,
+                               key=lambda row: (o_degrees[row], row))
+
+    def column_degrees(self, a, columns, i):
+        """
+        Counts the ones in V of columns
+
+        Arguments:
+        a       -- BitMatrix representing matrix A
+        columns -- Numpy array of integer columns of V
+        i       -- Integer representing i'th iteration of reducing V
+
+        Returns a numpy array of counts, one per column
+        """
+        physical = a.order[columns]
+        shifts = (physical % WORD_BITS).astype(WORD_DTYPE)
+        words = a.words[i:, physical // WORD_BITS]
+        return ((words >> shifts) & numpy.uint64(1)).sum(axis=0)
+
+
+class ColumnDegreePivoting(Pivoting):
+    """
+    The rule of RFC 5053 with ties among rows with the fewest ones in V
+    other than two broken by their columns instead of original degree.
+    Of the candidate rows the one whose ones in V fill the most of V is
+    chosen, as taking its columns out of V lowers the count of the most
+    rows and leaves more rows with a single one.  The pivot column is
+    the row's column with the fewest ones, the cheapest to clear
+    """
+
+    name = "column-degree"
+
+    def choose(self, raptor, a, buckets, components, o_degrees, i, u):
+        """
+        Chooses the pivot of step i of phase 1, see Pivoting.choose
+        """
+        r, rows = buckets.minimum()
+        if r == 2:
+            return super(ColumnDegreePivoting, self).choose(
+                raptor, a, buckets, components, o_degrees, i, u
+            )
+
+        best = None
+        for row in self.candidates(rows, o_degrees):
+            ones = a.ones(row, i, raptor.l - u)
+            degrees = self.column_degrees(a, ones, i)
+            key = (-int(degrees.sum()), o_degrees[row], row)
+            if best is None or key < best[0]:
+                best = (key, row, int(ones[degrees.argmin()]))
+        return best[1], best[2]
+
+
+class MarkowitzPivoting(Pivoting):
+    """
+    Markowitz rule.  Pivoting on a row with r ones in V and a column with
+    c ones in V xors the row into the c - 1 other rows with a one in that
+    column, filling them with up to (r - 1)(c - 1) ones in the columns it
+    inactivates.  The candidate rows with the fewest and one more than
+    the fewest ones in V are compared by that fill in for each of their
+    columns, then by the number of columns inactivated.  Rows with a
+    single one fill in nothing and are taken by original degree
+    """
+
+    name = "markowitz"
+
+    def choose(self, raptor, a, buckets, components, o_degrees, i, u):
+        """
+        Chooses the pivot of step i of phase 1, see Pivoting.choose
+        """
+        r, rows = buckets.minimum()
+        if r == 1:
+            row = self.candidates(rows, o_degrees)[0]
+            return row, int(a.ones(row, i, raptor.l - u)[0])
+
+        candidates = self.candidates(rows, o_degrees)
+        if r + 1 < len(buckets.buckets):
+            candidates += self.candidates(buckets.buckets[r + 1], o_degrees)
+
+        best = None
+        for row in candidates:
+            ones = a.ones(row, i, raptor.l - u)
+            degrees = self.column_degrees(a, ones, i)
+            n = degrees.argmin()
+            key = ((len(ones) - 1) * (int(degrees[n]) - 1), len(ones),
+                   o_degrees[row], row)
+            if best is None or key < best[0]:
+                best = (key, row, int(ones[n]))
+        return best[1], best[2]
+
+
+# Strategies by name
+STRATEGIES = dict((strategy.name, strategy) for strategy in
+                  (Pivoting, ColumnDegreePivoting, MarkowitzPivoting))
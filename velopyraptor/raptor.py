@@ -13,12 +13,17 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import atexit
+import heapq
 import math
 import matrix
-import networkx
 import numpy
+import threading
 from bitarray import bitarray
+from multiprocessing.pool import ThreadPool
 
+import bitmatrix
+import cache
 import config
 import distributions.degree as degree
 import distributions.gray as gray
@@ -26,18 +31,174 @@ import distributions.half as half
 import distributions.optimal_esi as optimal_esi
 import distributions.primes as primes
 import distributions.random as random
+from bitmatrix import BitMatrix
+from buckets import DegreeBuckets
+from components import Components
 from distributions.systematic_index import systematic_index
+from pivoting import Pivoting
 from schedule import Schedule
 
 MIN_K = 4
 MAX_K = 8192
 
+# Values of k whose precode rows are kept by every coder in the process
+PRECODE_CACHE = cache.LRUCache(32)
+
+# Values of k whose source symbol neighbors are kept, as (indptr, indices)
+SOURCE_NEIGHBOR_CACHE = cache.LRUCache(32)
+
+# Neighbors of repair symbols kept, by (k, esi)
+NEIGHBOR_CACHE = cache.LRUCache(1 << 16)
+
+# Intermediate symbol indices stay below 2 ** 16 as l <= 8192 + s + h
+NEIGHBOR_DTYPE = 'uint16'
+
+# Row pairs the prepass may compare for every row of A
+PREPASS_BUDGET = 64
+
+# Scratch rows the schedule optimizer may add to D
+MAX_TEMPS = 64
+
+# Largest symbol in bytes for which schedules are applied a wave at a time
+# and batches of symbols are encoded a neighbor at a time
+WAVE_SYMBOLSIZE = 1024
+
+# Bytes of a symbol combined at a time by xor_fused
+XOR_TILE = 262144
+
+# Widest block of U columns precomputed at once
+PRECOMPUTATION_BLOCK = 8
+
+# Values of k whose inverse of A for the source ids is kept
+INVERSE_CACHE = cache.LRUCache(64)
+
+# Largest k encoded through the inverse of A
+INVERSE_MAX_K = 64
+
+# Bytes of every symbol multiplied by the inverse of A at a time
+INVERSE_TILE = 4096
+
+# Bytes xored in about the time building a schedule takes per source symbol
+SCHEDULE_BYTES = 1 << 20
+
 if config._64BIT:
     DTYPE = 'uint64'
 else:
     DTYPE = 'uint32'
 
 
+# Thread pools shared by every coder, by number of workers
+THREAD_POOLS = {}
+THREAD_POOLS_LOCK = threading.Lock()
+
+
+def gray_ranks(block):
+    """
+    Finds where the ones of each row of block come up in the Gray code
+    sequence, the first column being the lowest bit
+
+    Arguments:
+    block -- 2D numpy bool array
+
+    Returns a numpy array of integer positions, 0 for rows of zeros
+    """
+    codes = block.dot(1 << numpy.arange(block.shape[1], dtype='int64'))
+    ranks = codes.copy()
+    codes >>= 1
+    while codes.any():
+        ranks ^= codes
+        codes >>= 1
+    return ranks
+
+
+def index_ones(a):
+    """
+    Indexes the ones of a both ways, so rows sharing columns are found
+    without scanning a
+
+    Arguments:
+    a -- BitMatrix
+
+    Returns a tuple (list of the set of columns with a one in each row,
+    list of the set of rows with a one in each column)
+    """
+    bits = a.tobool()
+    rows, columns = numpy.nonzero(bits)
+    bounds = numpy.searchsorted(rows, numpy.arange(len(a) + 1))
+    ones = [set(columns[bounds[r]:bounds[r + 1]].tolist())
+            for r in xrange(len(a))]
+    columns, rows = numpy.nonzero(bits.T)
+    bounds = numpy.searchsorted(columns, numpy.arange(a.columns + 1))
+    index = [set(rows[bounds[c]:bounds[c + 1]].tolist())
+             for c in xrange(a.columns)]
+    return ones, index
+
+
+def combination_xors(block):
+    """
+    Counts the XORs needed to build the combinations of rows selected by
+    the rows of block in Gray code order and xor each into its row
+
+    Arguments:
+    block -- 2D numpy bool array
+
+    Returns an integer
+    """
+    if not block.size:
+        return 0
+    ranks = gray_ranks(block)
+    return int(ranks.max()) + int((ranks > 0).sum())
+
+
+def m4rm_block(columns, rows):
+    """
+    Chooses how many columns of a bit matrix the Method of Four Russians
+    takes at once when multiplying it by a matrix of symbols.  Every
+    block of b columns costs 2 ** b - 1 XORs to tabulate the combinations
+    of its b symbols and one XOR per row to look them up
+
+    Arguments:
+    columns -- Integer number of columns of the bit matrix
+    rows -- Integer number of rows of the bit matrix
+
+    Returns a tuple (integer columns per block, integer XORs)
+    """
+    xors, b = min((((1 << b) - 1 + rows) * -(-columns // b), b)
+                  for b in xrange(1, PRECOMPUTATION_BLOCK + 1))
+    return b, xors
+
+
+def thread_pool(workers):
+    """
+    Returns the shared pool of worker threads for a number of workers,
+    starting it the first time
+
+    Arguments:
+    workers -- Integer number of threads
+    """
+    with THREAD_POOLS_LOCK:
+        pool = THREAD_POOLS.get(workers)
+        if pool is None:
+            pool = THREAD_POOLS[workers] = ThreadPool(workers)
+        return pool
+
+
+def close_thread_pools():
+    """
+    Closes the shared pools of worker threads and waits for their
+    threads to finish.  Pools are started again when next needed.
+    Called when the process exits
+    """
+    with THREAD_POOLS_LOCK:
+        pools = THREAD_POOLS.values()
+        THREAD_POOLS.clear()
+    for pool in pools:
+        pool.close()
+        pool.join()
+
+atexit.register(close_thread_pools)
+
+
 class RaptorR10ParameterException(Exception):
 
     """
@@ -87,7 +248,12 @@ class RaptorR10(object):
     on the known symbols to produce the intermediate symbols
     """
 
-    def __init__(self, k, use_prepass=True, use_optimal_esis=False):
+    def __init__(self, k, use_prepass=True, use_optimal_esis=False,
+                 prepass_budget=PREPASS_BUDGET, optimize_schedule=True,
+                 max_temps=MAX_TEMPS, workers=1, stripe_size=None,
+                 use_precomputation=True, u_lower_block=None,
+                 use_peeling=False, use_inverse=True, pivoting=None,
+                 use_hdpc_inactivation=False):
         """
         Arguments:
         k -- Integer representing number of source symbols.
@@ -97,11 +263,64 @@ class RaptorR10(object):
         use_prepass -- Boolean Sets wether or not a prepass should be made
         use_optimal_esis -- Attempts to produce only symbols requiring
             the least amount of XORS.
+        prepass_budget -- Integer maximum number of row pairs the prepass
+            compares per row of A. None for no limit
+        optimize_schedule -- Boolean Sets wether or not the decoding
+            schedule is optimized before it is applied to symbols
+        max_temps -- Integer maximum number of scratch symbols the
+            schedule optimizer may use. None for no limit
+        workers -- Integer number of threads applying schedules and
+            encoding symbols, one stripe of every symbol at a time
+        stripe_size -- Integer bytes of each symbol per stripe.  None for
+            one stripe per worker
+        use_precomputation -- Boolean Sets wether or not U_upper is
+            cleared with the precomputation of RFC 5053 phases 3 and 4
+        u_lower_block -- Integer number of columns of U_lower eliminated
+            at once.  None to choose from the size of U_lower
+        use_peeling -- Boolean Sets wether or not rows with a single one
+            are peeled off through a sparse index before phase 1
+        use_inverse -- Boolean Sets wether or not the source symbols of
+            k up to INVERSE_MAX_K may be multiplied by a cached inverse of
+            A instead of scheduled, see calculate_i_symbols
+        pivoting -- Pivoting choosing the pivot of each step of phase 1.
+            None for the rule of RFC 5053
+        use_hdpc_inactivation -- Boolean Sets wether or not the hdpc rows
+            are left out of phase 1 and their columns inactivated up front,
+            see inactivate_hdpc
         """
         self.set_params(k)
 
         # Set prepass
         self.use_prepass = use_prepass
+        self.prepass_budget = prepass_budget
+
+        # Set schedule optimization
+        self.optimize_schedule = optimize_schedule
+        self.max_temps = max_temps
+
+        # Set striping of symbols over threads
+        self.workers = max(1, workers)
+        self.stripe_size = stripe_size
+
+        # Set U_upper precomputation
+        self.use_precomputation = use_precomputation
+
+        # Set blocking of U_lower elimination
+        self.u_lower_block = u_lower_block
+
+        # Set peeling front end of phase 1
+        self.use_peeling = use_peeling
+
+        # Set multiplying by the inverse of A for small k
+        self.use_inverse = use_inverse
+
+        # Set the pivot rule of phase 1
+        if pivoting is None:
+            pivoting = Pivoting()
+        self.pivoting = pivoting
+
+        # Set leaving the hdpc rows to the elimination of U_lower
+        self.use_hdpc_inactivation = use_hdpc_inactivation
 
         # Set optimal_symbols
         self.use_optimal_esis = use_optimal_esis
@@ -113,6 +332,14 @@ class RaptorR10(object):
         # this should be a list tuples consisting of (id, content)
         self.symbols = []
 
+        # Calculated from the symbols when needed
+        self.i_symbols = None
+
+        # Source symbols among the symbols, see source_symbols
+        self.sources = {}
+        self.sources_of = None
+        self.sources_read = 0
+
     def _get_next_id(self):
         """
         Returns the next id to produce the next encoded symbol
@@ -125,14 +352,53 @@ class RaptorR10(object):
         self.current_id += 1
         return r
 
+    def next_ids(self, n):
+        """
+        Returns the ids of the next n encoded symbols, as next would
+        produce them
+
+        Arguments:
+        n -- Integer number of ids
+        """
+        return [self._get_next_id() for i in xrange(n)]
+
     def next(self):
         """
         Returns the next encoded symbol
         Return is a tuple (symbol id, bitarray)
         """
         symbol_id = self._get_next_id()
+        source = self.source_symbols().get(symbol_id)
+        if source is not None:
+            return symbol_id, source
         return symbol_id, self.ltenc(symbol_id)
 
+    def source_symbols(self):
+        """
+        Finds the source symbols (ids below k) among the symbols.  R10 is
+        systematic so these are passed through untouched rather than
+        encoded.  Symbols appended since the last call are added as they
+        come
+
+        Returns a dictionary of integer id to numpy array
+        """
+        if self.sources_of is not self.symbols:
+            self.sources = {}
+            self.sources_of = self.symbols
+            self.sources_read = 0
+
+        for esi, symbol in self.symbols[self.sources_read:]:
+            if esi < self.k:
+                self.sources.setdefault(esi, symbol)
+        self.sources_read = len(self.symbols)
+        return self.sources
+
+    def has_all_sources(self):
+        """
+        Returns True if every source symbol is among the symbols
+        """
+        return len(self.source_symbols()) == self.k
+
     def set_params(self, k):
         """
         Determines the parameters of the R10 encoder using k
@@ -217,57 +483,320 @@ class RaptorR10(object):
         b = random.R10(Y, 2, self.l_prime)
         return (d, a, b)
 
-    def calculate_d(self):
+    def triples(self, esis):
+        """
+        Calculates the triples (d, a, b) of a numpy array of ids at once.
+        Matches triple for every id
+
+        Arguments:
+        esis -- Numpy array of integer ids
+
+        Returns a tuple of numpy arrays (d, a, b)
+        """
+        Q = 65521
+        A = (53591 + self.systematic_index * 997) % Q
+        B = 10267 * (self.systematic_index + 1) % Q
+        Y = (B + numpy.asarray(esis, dtype='int64') * A) % Q
+        v = random.R10_array(Y, 0, 1048576)
+        d = degree.R10_array(v)
+        a = 1 + random.R10_array(Y, 1, self.l_prime - 1)
+        b = random.R10_array(Y, 2, self.l_prime)
+        return d, a, b
+
+    def neighbor_lists(self, esis):
+        """
+        Finds the intermediate symbols xored together by LTEnc for a numpy
+        array of ids at once.  Every id walks its (d, a, b) sequence in
+        step with the others.  Matches neighbors for every id
+
+        Arguments:
+        esis -- Numpy array of integer ids
+
+        Returns a tuple of numpy arrays (indptr, indices) in compressed
+        sparse row form.  The neighbors of esis[n] are
+        indices[indptr[n]:indptr[n + 1]]
+        """
+        d, a, b = self.triples(esis)
+        d = numpy.minimum(d, self.l)
+        table = numpy.empty((len(d), int(d.max()) if len(d) else 0),
+                            dtype='int64')
+        for j in xrange(table.shape[1]):
+            walking = j < d
+            if j:
+                b[walking] = (b[walking] + a[walking]) % self.l_prime
+            rejected = walking & (b >= self.l)
+            while rejected.any():
+                b[rejected] = (b[rejected] + a[rejected]) % self.l_prime
+                rejected &= b >= self.l
+            table[:, j] = b
+
+        indptr = numpy.zeros(len(d) + 1, dtype='int64')
+        numpy.cumsum(d, out=indptr[1:])
+        indices = table[numpy.arange(table.shape[1]) < d[:, None]]
+        return indptr, indices
+
+    def lt_words(self, esis):
+        """
+        Builds the packed lt rows of a sequence of ids
+
+        Arguments:
+        esis -- Sequence of integer ids
+
+        Returns a numpy array of rows of uint64 words, one per id
+        """
+        arrays = self.neighbor_arrays(esis)
+        bits = numpy.zeros((len(arrays), self.l), dtype=bool)
+        if arrays:
+            rows = numpy.repeat(numpy.arange(len(arrays)),
+                                [len(neighbors) for neighbors in arrays])
+            bits[rows, numpy.concatenate(arrays)] = True
+        return bitmatrix.pack(bits)
+
+    def calculate_d(self, extra=0, rows=None):
         """
         Doesnt really do much except s + h 0 symbols
         to the source block
 
-        Returns a matrix prepended by s + h zero rows
-        and the symbols
+        Keyword Arguments:
+        extra -- Integer number of zero rows appended after the symbols
+        rows -- Iterable of the integer rows to fill with their symbol.
+            None for every symbol.  The others are left as zeros
+
+        Returns a 2D numpy array of s + h zero rows, the symbols and
+        extra zero rows
         """
-        d = []
         symbolsize = len(self.symbols[0][1])
-
-        # Creates the first s + h 0 rows of length symbolsize
-        zeros = numpy.zeros(symbolsize, dtype=DTYPE)
-        for i in xrange(self.s + self.h):
-            d.append(numpy.array(zeros, copy=True))
-
-        # Append the symbols that we do have
-        for id, symbol in self.symbols:
-            d.append(symbol)
+        first = self.s + self.h
+        d = numpy.zeros((first + len(self.symbols) + extra, symbolsize),
+                        dtype=DTYPE)
+
+        # Copy in the symbols that we do have
+        if rows is None:
+            rows = xrange(first, first + len(self.symbols))
+        for row in rows:
+            if first <= row < first + len(self.symbols):
+                d[row] = self.symbols[row - first][1]
         return d
 
-    def ltenc(self, id):
+    def neighbors(self, id):
         """
-        Performs the ltencoding
-        Symbols are produced by xoring a set of intermediate symbols together
+        Finds the intermediate symbols xored together by LTEnc.  Source
+        symbols are looked up in the table for k and repair symbols are
+        kept in NEIGHBOR_CACHE once walked
 
         Arguments:
         id -- Integer that indicates the id'th symbol is to be encoded
 
-        Returns a numpy array
+        Returns a read only numpy array of uint16 intermediate symbol
+        indices
         """
+        neighbors = self.cached_neighbors(id)
+        if neighbors is not None:
+            return neighbors
 
         d, a, b = self.triple(id)
         while b >= self.l:
             b = (b + a) % self.l_prime
 
-        result = numpy.array(self.i_symbols[b], copy=True)
-
+        neighbors = [b]
         for j in xrange(1, min(d, self.l)):
             b = (b + a) % self.l_prime
             while b >= self.l:
                 b = (b + a) % self.l_prime
-            self.xor_arrays(self.i_symbols[b], result)
-        return result
+            neighbors.append(b)
+        return self.cache_neighbors(id, numpy.array(neighbors))
+
+    def neighbor_arrays(self, esis):
+        """
+        Finds the neighbors of a sequence of ids, walking any not cached
+        together with neighbor_lists
+
+        Arguments:
+        esis -- Sequence of integer ids
+
+        Returns a list of read only numpy arrays of uint16 intermediate
+        symbol indices
+        """
+        arrays = [self.cached_neighbors(esi) for esi in esis]
+        missing = [n for n, neighbors in enumerate(arrays)
+                   if neighbors is None]
+        if missing:
+            walked = numpy.array([esis[n] for n in missing], dtype='int64')
+            indptr, indices = self.neighbor_lists(walked)
+            for j, n in enumerate(missing):
+                arrays[n] = self.cache_neighbors(
+                    int(walked[j]), indices[indptr[j]:indptr[j + 1]]
+                )
+        return arrays
+
+    def source_neighbors(self):
+        """
+        The neighbors of the k source symbols, built once per k and
+        shared through SOURCE_NEIGHBOR_CACHE
+
+        Returns a tuple of read only numpy arrays (indptr, uint16
+        indices) as returned by neighbor_lists
+        """
+        table = SOURCE_NEIGHBOR_CACHE.get(self.k)
+        if table is None:
+            indptr, indices = self.neighbor_lists(numpy.arange(self.k))
+            table = (indptr, indices.astype(NEIGHBOR_DTYPE))
+            for array in table:
+                array.flags.writeable = False
+            SOURCE_NEIGHBOR_CACHE.put(self.k, table)
+        return table
+
+    def cached_neighbors(self, id):
+        """
+        Looks up the neighbors of id without walking them
+
+        Arguments:
+        id -- Integer id of an encoded symbol
+
+        Returns a numpy array of uint16 or None when not cached
+        """
+        if id < self.k:
+            indptr, indices = self.source_neighbors()
+            return indices[indptr[id]:indptr[id + 1]]
+        return NEIGHBOR_CACHE.get((self.k, id))
+
+    def cache_neighbors(self, id, neighbors):
+        """
+        Keeps the neighbors of a repair symbol in NEIGHBOR_CACHE
+
+        Arguments:
+        id -- Integer id of an encoded symbol
+        neighbors -- Sequence of integer intermediate symbol indices
+
+        Returns the cached read only numpy array of uint16
+        """
+        neighbors = numpy.array(neighbors, dtype=NEIGHBOR_DTYPE)
+        neighbors.flags.writeable = False
+        if id >= self.k:
+            NEIGHBOR_CACHE.put((self.k, id), neighbors)
+        return neighbors
+
+    def ltenc(self, id):
+        """
+        Performs the ltencoding
+        Symbols are produced by xoring a set of intermediate symbols together
+
+        Arguments:
+        id -- Integer that indicates the id'th symbol is to be encoded
+
+        Returns a numpy array
+        """
+        return self.generate([id])[0]
+
+    def generate(self, esis, out=None):
+        """
+        Encodes a batch of symbols at once.  Source symbols among the
+        symbols are copied as they are.  Every other symbol starts as a
+        copy of its first neighbor and then takes its j'th neighbor in
+        step j.
+        For symbols of up to WAVE_SYMBOLSIZE bytes each step is a single
+        fancy indexed xor over every symbol still having a j'th neighbor,
+        larger ones combine all their neighbors at once with xor_fused
+
+        Arguments:
+        esis -- Sequence of integer ids of the symbols to encode
+
+        Keyword Arguments:
+        out -- 2D numpy array with a row per id to fill.  None to allocate
+            one.  Raises a ValueError unless its shape and dtype match the
+            symbols
+
+        Returns the 2D numpy array of encoded symbols, one row per id
+        """
+        sources = self.source_symbols()
+        rows = [n for n, esi in enumerate(esis) if esi not in sources]
+        if rows and self.i_symbols is None:
+            self.calculate_i_symbols()
+
+        if self.i_symbols is not None:
+            shape = (len(esis), self.i_symbols.shape[1])
+            dtype = self.i_symbols.dtype
+        else:
+            shape = (len(esis), len(self.symbols[0][1]))
+            dtype = numpy.asarray(self.symbols[0][1]).dtype
+        if out is None:
+            out = numpy.empty(shape, dtype=dtype)
+        elif out.shape != shape or out.dtype != dtype:
+            raise ValueError("Output of shape %s and dtype %s cannot hold "
+                             "symbols of shape %s and dtype %s" %
+                             (out.shape, out.dtype, shape, dtype))
+
+        for n, esi in enumerate(esis):
+            if esi in sources:
+                out[n] = sources[esi]
+        if not rows:
+            return out
+
+        arrays = self.neighbor_arrays([esis[n] for n in rows])
+        rows = numpy.array(rows)
+
+        # Neighbors laid out by step
+        degrees = numpy.array([len(neighbors) for neighbors in arrays])
+        table = numpy.zeros((len(arrays), degrees.max()), dtype='int64')
+        table[numpy.arange(table.shape[1]) < degrees[:, None]] = \
+            numpy.concatenate(arrays)
+
+        def encode(stripe):
+            i_symbols = self.i_symbols[:, stripe]
+            target = out[:, stripe]
+            if target[0].nbytes > WAVE_SYMBOLSIZE:
+                for row, neighbors in zip(rows.tolist(), arrays):
+                    self.xor_fused(i_symbols, neighbors, target[row])
+                return
+
+            target[rows] = i_symbols[table[:, 0]]
+            for j in xrange(1, table.shape[1]):
+                walking = numpy.flatnonzero(degrees > j)
+                target[rows[walking]] ^= i_symbols[table[walking, j]]
+
+        self.striped(encode, shape[1])
+        return out
+
+    def stripes(self, width):
+        """
+        Splits the words of a symbol into stripes of stripe_size bytes, or
+        one stripe per worker when no stripe size is set
+
+        Arguments:
+        width -- Integer number of words in a symbol
+
+        Returns a list of slices
+        """
+        if self.stripe_size:
+            size = max(1, self.stripe_size // numpy.dtype(DTYPE).itemsize)
+        else:
+            size = max(1, -(-width // self.workers))
+        return [slice(start, start + size) for start in xrange(0, width, size)]
+
+    def striped(self, function, width):
+        """
+        Calls function once per stripe of the words of a symbol.  XOR works
+        on every word independently, so stripes need no coordination and
+        are spread over a pool of worker threads when workers > 1.  numpy
+        releases the GIL while xoring
+
+        Arguments:
+        function -- Function taking a slice of words
+        width -- Integer number of words in a symbol
+        """
+        stripes = self.stripes(width)
+        if self.workers > 1 and len(stripes) > 1:
+            thread_pool(self.workers).map(function, stripes)
+        else:
+            for stripe in stripes:
+                function(stripe)
 
     def min_degree_row(self, a, o_degrees, m, i, u, rows_with_r):
         """
         Chooses a minimum degree row out of rows with r
 
         Arguments:
-        a           -- List of bitarrays representing matrix a
+        a           -- BitMatrix representing matrix a
         o_degrees   -- List of original row degrees
         m           -- Integer n + s + h(a should have m rows)
         i           -- Integer representing the i'th
@@ -285,87 +814,188 @@ class RaptorR10(object):
                 min_row = r
         return min_row
 
-    def row_from_graph(self, a, m, i, u, rows_with_r):
+    def row_from_graph(self, components):
         """
-        Builds a graph from rows where rows are edges and columns are vertices.
-        Then chooses the first edge from the largest component
+        Rows with two ones in V are edges of a graph whose vertices are
+        the columns of V.  Chooses a row from the largest component
 
         Arguments:
-        a           -- List of bitarrays representing matrix A
-        m           -- Integer total number of rows in A
-        i           -- Integer representing i'th iteration of reducing V
-        u           -- Integer representing number of columns in u
-        rows_with_r -- List of row indexes that share the same number of ones
-                       in V
+        components -- Components tracking the rows with two ones in V
         """
-        graph = networkx.Graph()
-        for row in rows_with_r:
-            vertices = []
-            for vertex in xrange(i, self.l - u):
-                if a[row][vertex]:
-                    vertices.append(vertex)
-            v1, v2 = tuple(vertices)
-            graph.add_edge(v1, v2, row_index=row)
-
-        # Calculate components in graph
-        components = networkx.connected_component_subgraphs(graph)
-
-        # Find the max component
-        max_component = None
-        max_size = 0
-        for c in components:
-            edges = c.edges(data=True)
-            if len(edges) > max_size:
-                max_component = edges
-                max_size = len(edges)
+        return components.largest()
 
-        _, _, data = max_component[0]
-        row = data['row_index']
-        return row
+    def update_degrees(self, a, buckets, components, rows, i, u):
+        """
+        Recounts the ones in V for rows and moves them between degree
+        buckets.  Rows left with two ones in V become edges between their
+        two columns, rows that no longer have two stop being edges.
 
-    def rows_with_min_r(self, a, m, i, u):
+        Arguments:
+        a          -- BitMatrix representing matrix A
+        buckets    -- DegreeBuckets holding the number of ones in V per row
+        components -- Components tracking the rows with two ones in V
+        rows       -- Numpy array of row indexes to recount
+        i          -- Integer representing i'th iteration of reducing V
+        u          -- Integer representing number of columns in u
+        """
+        counts = a.counts_of(rows, a.mask(i, self.l - u))
+        for row, count in zip(rows.tolist(), counts.tolist()):
+            if row in buckets and buckets.degree(row) == count:
+                continue
+            if row in components:
+                components.remove(row)
+            buckets.update(row, count)
+            if count == 2:
+                # Vertices are physical columns which never move
+                c1, c2 = a.order[a.ones(row, i, self.l - u)].tolist()
+                components.add(row, c1, c2)
+
+    def rows_with_min_r(self, buckets):
         """
         Returns a tuple with the minimum number of 1s in a row in v
         and the indexes of the rows containing that number of 1s
 
         Arguments:
-        a -- List of bitarrays representing the matrix A
-        m -- Integer total number of rows in A
-        i -- Integer indicating i'th iteration of reducing V in A
-        u -- Integer number of columns in matrix U
+        buckets -- DegreeBuckets holding the number of ones in v for each
+                   row of v
 
-        Returns tuple (minimum r, list of rows with minimum r)
+        Returns tuple (minimum r, sorted list of rows with minimum r)
         """
-        # Find minimum number of ones in a row in sub matrix v.
-        min_r = None
-        rows_with_min_r = []
-        for row_index in xrange(i, m):
-            v_row = a[row_index][i:(self.l - u)]
+        min_r, rows = buckets.minimum()
+        return min_r, sorted(rows)
 
-            # let r be the number of ones in a row in v
-            r = v_row.count()
+    def calculate_i_symbols(self):
+        """
+        Calculates the intermediate symbols into self.i_symbols, a 2D
+        numpy array of l rows.
+
+        Small encoders multiply the source symbols by the cached inverse
+        of A when inverse_is_cheaper.  Otherwise the raptor decoding
+        process builds and optimizes a schedule, see compile_schedule,
+        which is applied to D with its scratch rows (schedule.temps)
+        appended.  The intermediate symbols are then the rows of D that
+        schedule.d and schedule.c place them in
+        """
 
-            # Ignore rows
-            if r == 0:
-                continue
+        if self.inverse_is_cheaper():
+            self.multiply_inverse()
+            return
 
-            if min_r is None or r < min_r:
-                min_r = r
-                rows_with_min_r = [row_index]
-            elif r == min_r:
-                rows_with_min_r.append(row_index)
+        schedule = self.compile_schedule()
+        D = self.calculate_d(schedule.temps)
 
-        return min_r, rows_with_min_r
+        self.xors = len(schedule.xors)
+        self.apply_schedule(D, schedule)
 
-    def calculate_i_symbols(self):
-        """
-        Calculates list of intermediate symbols.
-        Applies the raptor decoding process to prevent multiplying the inverse
-        of a by the source symbols
+        self.i_symbols = numpy.empty((self.l, D.shape[1]), dtype=DTYPE)
+        self.i_symbols[schedule.c] = D[schedule.d[:self.l]]
 
-        Returns list of numpy arrays representing intermediate symbols
+    def inverse_is_cheaper(self):
+        """
+        Decides whether the symbols are multiplied by the cached inverse
+        of A rather than decoded with a schedule.  That is only possible
+        for the source symbols in order, as encoders have them.  Building
+        a schedule costs more than applying it to small symbols.  The
+        inverse is used when its XORs take fewer bytes than the schedule's
+        plus SCHEDULE_BYTES per source symbol for building it
+
+        Returns a boolean
+        """
+        if not self.use_inverse or self.k > INVERSE_MAX_K or \
+                len(self.symbols) != self.k:
+            return False
+        for n, (esi, symbol) in enumerate(self.symbols):
+            if esi != n:
+                return False
+        inverse, xors = self.source_inverse()
+        block, cost = m4rm_block(self.k, self.l)
+        size = self.symbols[0][1].nbytes
+        return cost * size <= xors * size + self.k * SCHEDULE_BYTES
+
+    def source_inverse(self):
+        """
+        The columns of the inverse of A for the source ids 0..k-1 that
+        multiply the k source symbols.  Decoding symbols that are the
+        rows of the k x k identity packed into words gives exactly these
+        columns as intermediate symbols.  The identity is decoded in words
+        of its own rather than DTYPE, which is too narrow for more than 32
+        columns on 32 bit builds.  They depend only upon k so they are
+        built once per k and shared through INVERSE_CACHE
+
+        Returns a tuple (read only numpy array of l rows of uint64 words,
+        integer XORs of the schedule)
+        """
+        cached = INVERSE_CACHE.get(self.k)
+        if cached is None:
+            r = RaptorR10(self.k, use_inverse=False)
+            identity = bitmatrix.pack(numpy.eye(self.k, dtype=bool))
+            r.symbols = list(enumerate(identity))
+            schedule = r.compile_schedule()
+
+            first = self.s + self.h
+            D = numpy.zeros((first + self.k + schedule.temps,
+                             identity.shape[1]), dtype=bitmatrix.WORD_DTYPE)
+            D[first:first + self.k] = identity
+            r.apply_schedule(D, schedule)
+
+            inverse = numpy.empty((self.l, D.shape[1]),
+                                  dtype=bitmatrix.WORD_DTYPE)
+            inverse[schedule.c] = D[schedule.d[:self.l]]
+            inverse.flags.writeable = False
+            cached = (inverse, len(schedule.xors))
+            INVERSE_CACHE.put(self.k, cached)
+        return cached
+
+    def multiply_inverse(self):
         """
+        Calculates the intermediate symbols as the inverse of A times the
+        source symbols by the Method of Four Russians.  The columns of the
+        inverse are taken b at a time.  The 2 ** b combinations of their b
+        symbols are tabulated, each with one XOR by doubling the table
+        one symbol at a time, and every intermediate symbol xors in the
+        combination its b bits select.  See m4rm_block
+        """
+        inverse, xors = self.source_inverse()
+        bits = bitmatrix.unpack(inverse, self.k)
+        block, cost = m4rm_block(self.k, self.l)
+        self.xors = cost
+        self.stats = {"xors": cost}
+
+        sources = numpy.array([symbol for esi, symbol in self.symbols],
+                              dtype=DTYPE)
+        self.i_symbols = numpy.zeros((self.l, sources.shape[1]),
+                                     dtype=DTYPE)
+        weights = 1 << numpy.arange(block, dtype='int64')
+        blocks = [(start, bits[:, start:start + block].dot(
+            weights[:min(block, self.k - start)]))
+            for start in xrange(0, self.k, block)]
+
+        # Tables are built a tile of words at a time to stay in cache
+        size = max(1, INVERSE_TILE // numpy.dtype(DTYPE).itemsize)
+
+        def multiply(stripe):
+            for tile in xrange(stripe.start, stripe.stop, size):
+                tile = slice(tile, min(tile + size, stripe.stop))
+                i_symbols = self.i_symbols[:, tile]
+                table = numpy.empty((1 << block, i_symbols.shape[1]),
+                                    dtype=DTYPE)
+                table[0] = 0
+                for start, combinations in blocks:
+                    symbols = sources[start:start + block, tile]
+                    for j, symbol in enumerate(symbols):
+                        numpy.bitwise_xor(table[:1 << j], symbol,
+                                          out=table[1 << j:2 << j])
+                    i_symbols ^= table[combinations]
+
+        self.striped(multiply, sources.shape[1])
+
+    def compile_schedule(self):
+        """
+        Builds the decoding schedule of the symbols and, unless disabled,
+        optimizes it before it touches any symbols
 
+        Returns a Schedule
+        """
         if len(self.symbols) < self.k:
             raise RaptorR10DecodingScheduleException(
                 "Need at least %s symbols decode but only have %s." %
@@ -375,15 +1005,44 @@ class RaptorR10(object):
         a = self.a()
         schedule = self.decoding_schedule(a)
 
-        D = self.calculate_d()
+        # Drop and share XORs before touching any symbols
+        if self.optimize_schedule:
+            removed = schedule.optimize(self.max_temps)
+            for key, value in removed.iteritems():
+                self.stats["%s_xors" % key] = value
+        return schedule
 
-        self.xors = len(schedule.xors)
-        self.i_symbols = [None for i in xrange(self.l)]
-        for xor_row, target_row in schedule.xors:
-            self.xor_arrays(D[xor_row], D[target_row])
+    def apply_schedule(self, D, schedule):
+        """
+        Applies the xors of schedule to the rows of D.
+
+        Small symbols are bound by the cost of calling into numpy, so the
+        XORs are grouped into waves of independent XORs and each wave is
+        applied at once with fancy indexing.  Symbols larger than
+        WAVE_SYMBOLSIZE bytes are xored in place one XOR at a time as
+        gathering and scattering them costs more than the calls saved
 
-        for i in xrange(self.l):
-            self.i_symbols[schedule.c[i]] = D[schedule.d[i]]
+        Every stripe of the symbols replays the whole schedule, see
+        striped.
+
+        Arguments:
+        D -- 2D numpy array of rows the schedule was built for
+        schedule -- Schedule to apply
+        """
+        waves = None
+        if D[0].nbytes <= WAVE_SYMBOLSIZE:
+            waves = schedule.waves()
+
+        def apply(stripe):
+            d = D[:, stripe]
+            if waves is None:
+                for xor_row, target_row in schedule.xors:
+                    self.xor_arrays(d[xor_row], d[target_row])
+            else:
+                for sources, targets in waves:
+                    d[targets] ^= d[sources]
+
+        self.striped(apply, D.shape[1])
 
     def decoding_schedule(self, a):
         """
@@ -400,7 +1059,7 @@ class RaptorR10(object):
         schedule = Schedule(self.l, (self.s + self.h + len(self.symbols)))
 
         # Original degrees
-        o_degrees = [row.count() for row in a]
+        o_degrees = a.counts().tolist()
 
         # Take a quick stab at trying to reduce the number of xors
         if self.use_prepass:
@@ -410,114 +1069,451 @@ class RaptorR10(object):
         i = 0
         u = 0
 
+        # Resolve rows with a single one without scanning a
+        if self.use_peeling:
+            i = self.peel(a, o_degrees, schedule)
+
+        # Rows from end on are never chosen
+        end = m
+        if self.use_hdpc_inactivation:
+            rows, u = self.inactivate_hdpc(a, o_degrees, i, schedule)
+            end = m - rows
+
+        # Number of ones in each row of v kept in buckets by count
+        buckets = DegreeBuckets([])
+        components = Components()
+        self.update_degrees(a, buckets, components, numpy.arange(end), i, u)
+
         # Keep iterating until matrix V is gone leaving, I, U, and zero sub
         # matrices
         while (i + u) < self.l:
 
-            r, rows_with_r = self.rows_with_min_r(a, m, i, u)
-            if r == 2:
-                row = self.row_from_graph(a, m, i, u, rows_with_r)
-            else:
-                row = self.min_degree_row(a, o_degrees, m, i, u, rows_with_r)
-
-            if r == 0:
+            if not buckets.minimum()[0]:
+                if end < m:
+                    # The columns left in V are solved with the hdpc rows
+                    u = self.l - i
+                    break
                 raise RaptorR10DecodingScheduleException(
                     "No nonzero row to choose from v"
                 )
+            row, column = self.pivoting.choose(self, a, buckets, components,
+                                               o_degrees, i, u)
 
-            # Exchange row with first row of v
+            # Exchange row with first row of v. Row i then leaves v
             self.exchange_row(a, o_degrees, i, row, schedule)
+            buckets.exchange(i, row)
+            buckets.remove(i)
+            components.exchange(i, row)
+            if i in components:
+                components.remove(i)
 
-            # Reorder columns -- place a 1 in first column of v,
+            # Reorder columns -- place the pivot in first column of v,
             # place remaining ones in right side of v by reordering columns
-            # locate 1s
-            ones = set()
-            [ones.add(column)
-                for column in xrange(i, self.l - u) if a[i][column]]
-
-            # Exchange column i with first one column
-            if not a[i][i]:
-                column = ones.pop()
+            if column != i:
                 self.exchange_column(a, i, column, schedule)
-            else:
-                ones.remove(i)
+            ones = set(a.ones(i, i + 1, self.l - u).tolist())
+            r = len(ones) + 1
 
             # Align the rest up to the right
             column = self.l - u - 1
             while column > i and len(ones) > 0:
-                if not a[i][column]:
+                if not a.get(i, column):
                     self.exchange_column(a, column, ones.pop(), schedule)
                 else:
                     ones.remove(column)
                 column -= 1
 
+            # Column i and the r - 1 columns at the right of v leave v.
+            # Only rows with ones in those columns change their count
+            leaving = a.mask(i, i + 1) | a.mask(self.l - u - r + 1,
+                                                self.l - u)
+            changed = a.rows_touching(leaving, i + 1, end)
+
             # XOR all rows below a[i][i] that have 1
-            for row in xrange(i + 1, m):
-                if a[row][i]:
-                    self.xor_row(a, row, i, schedule)
+            self.xor_rows(a, a.rows_with(i, i + 1, m), i, schedule)
             i += 1
             u += r - 1
 
+            self.update_degrees(a, buckets, components, changed, i, u)
+        self.stats["inactivated"] = u
+
         # Matrix u is divided into the first i rows u_upper and m-i rows
         # u_lower. Perform gaussian elimination on u_lower so that the first u
         # rows are a u x u identity matrix
-        for column in xrange(self.l - u, self.l):
-            if not a[column][column]:
-                # find a row to swap
-                for row in xrange(column + 1, m):
-                    if a[row][column]:
-                        # swap rows row and column
-                        self.exchange_row(a, o_degrees, column, row, schedule)
-                        break
-
-                if not a[column][column]:
+        self.eliminate_u_lower(a, o_degrees, u, m, schedule)
+
+        # U upper should now be in upper triangular form. now attack the top
+        for column in xrange(self.l - 1, self.l - u - 1, -1):
+            self.xor_rows(a, a.rows_with(column, i, column), column, schedule)
+
+        # Rows left after l are discarded. a should now be l x l
+
+        # XOR to get rid of 1s in U_Upper.  Ones are visited row by row
+        # or through precomputed combinations of the rows of U
+        u_upper = a.tobool(0, i)[:, self.l - u:]
+        blocks, cost = self.precomputation_blocks(u_upper,
+                                                  schedule.temps > 0)
+        self.stats["u_upper_direct_xors"] = int(u_upper.sum())
+        self.stats["u_upper_precomputed_xors"] = cost
+        if self.use_precomputation:
+            self.precompute_u_upper(a, u_upper, blocks, schedule)
+        else:
+            rows, columns = numpy.nonzero(u_upper)
+            self.xor_pairs(a, rows, columns + self.l - u, schedule)
+
+        return schedule
+
+    def inactivate_hdpc(self, a, o_degrees, i, schedule):
+        """
+        Leaves the hdpc rows out of phase 1 in the manner of the RaptorQ
+        decoder of RFC 6330.  The h hdpc rows are about half ones, so
+        phase 1 choosing among them drags many of their ones into U.
+        They are instead exchanged below every other row, where phase 1
+        never chooses them, and the h columns of the hdpc symbols are
+        inactivated up front.  The LDPC and LT rows then cover the other
+        columns on their own.  Each pivot still clears its column from the
+        hdpc rows, which are folded in when U_lower is eliminated.
+
+        Arguments:
+        a -- BitMatrix representing a
+        o_degrees -- List of original degrees of rows
+        i -- Integer number of rows and columns already out of V
+        schedule -- Schedule to record the operations in
+
+        Returns a tuple (integer number of hdpc rows left out, integer
+        number of columns inactivated)
+        """
+        m = len(a)
+        first = self.s
+        rows = [row for row in xrange(i, m)
+                if first <= schedule.d[row] < first + self.h]
+        columns = [column for column in xrange(i, self.l)
+                   if schedule.c[column] >= self.l - self.h]
+
+        # Hdpc rows already at the bottom stay, the others are exchanged
+        # with the rows at the bottom that are not hdpc rows
+        bottom = m - len(rows)
+        upper = [row for row in rows if row < bottom]
+        lower = set(rows)
+        free = [row for row in xrange(bottom, m) if row not in lower]
+        for row, other in zip(upper, free):
+            self.exchange_row(a, o_degrees, row, other, schedule)
+
+        right = self.l - len(columns)
+        left = [column for column in columns if column < right]
+        placed = set(columns)
+        free = [column for column in xrange(right, self.l)
+                if column not in placed]
+        for column, other in zip(left, free):
+            self.exchange_column(a, column, other, schedule)
+        return len(rows), len(columns)
+
+    def peel(self, a, o_degrees, schedule):
+        """
+        Peeling (belief propagation) front end of phase 1.  A row with a
+        single one is resolved by xoring it into the other rows with a
+        one in its column, which only clears that column from them and
+        may leave them with a single one in turn.  Rows are followed
+        through per row and per column sets of ones as in the prepass,
+        so each step costs only the rows it touches.
+
+        The rows and columns peeled are then exchanged into the first
+        rows and columns, leaving a as phase 1 would after choosing each
+        of them with r = 1.  Stats record the number of rows peeled.
+
+        Arguments:
+        a -- BitMatrix representing a
+        o_degrees -- List of original degrees of rows
+        schedule -- Schedule to record the operations in
+
+        Returns the integer number of rows peeled
+        """
+        # Columns with a one in each row and rows with a one in each column
+        ones, index = index_ones(a)
+
+        # Like phase 1 the row of least original degree goes first
+        peeled = []
+        ripe = [(o_degrees[row], row) for row in xrange(len(a))
+                if len(ones[row]) == 1]
+        heapq.heapify(ripe)
+        while ripe:
+            degree, row = heapq.heappop(ripe)
+            if len(ones[row]) != 1:
+                continue
+            column, = ones[row]
+            peeled.append((row, column))
+
+            # Every other row loses column, the row itself is done
+            ones[row] = set()
+            index[column].discard(row)
+            for other in sorted(index[column]):
+                ones[other].discard(column)
+                schedule.xor(other, row)
+                if len(ones[other]) == 1:
+                    heapq.heappush(ripe, (o_degrees[other], other))
+            self.stats['xors'] += len(index[column])
+            index[column] = set()
+        self.stats['peeled_rows'] = len(peeled)
+        if not peeled:
+            return 0
+
+        # Peeled columns are now only set in their own row
+        bits = numpy.zeros(a.columns, dtype=bool)
+        bits[a.order[[column for row, column in peeled]]] = True
+        a.words &= ~bitmatrix.pack(bits)
+        for row, column in peeled:
+            a.set(row, column)
+
+        # Move the peeled rows and columns in front in the order peeled
+        row_at = range(len(a))
+        row_position = range(len(a))
+        column_at = range(a.columns)
+        column_position = range(a.columns)
+        for i, (row, column) in enumerate(peeled):
+            r = row_position[row]
+            if r != i:
+                self.exchange_row(a, o_degrees, i, r, schedule)
+                row_at[i], row_at[r] = row_at[r], row_at[i]
+                row_position[row_at[i]], row_position[row_at[r]] = i, r
+            c = column_position[column]
+            if c != i:
+                self.exchange_column(a, i, c, schedule)
+                column_at[i], column_at[c] = column_at[c], column_at[i]
+                column_position[column_at[i]] = i
+                column_position[column_at[c]] = c
+        return len(peeled)
+
+    def eliminate_u_lower(self, a, o_degrees, u, m, schedule):
+        """
+        Gaussian elimination of U_lower a block of columns at a time in
+        the manner of the Method of Four Russians.
+
+        The pivots of a block are found and reduced to an identity within
+        the block's columns first, looking only at the few columns of the
+        block.  Every row below then needs the combination of pivot rows
+        matching its ones in the block.  Like the precomputation of
+        U_upper the combinations are built in a scratch row in Gray code
+        order when that takes fewer XORs than xoring pivot rows one at a
+        time.
+
+        Arguments:
+        a -- BitMatrix representing a
+        o_degrees -- List of original degrees of rows
+        u -- Integer number of columns in U
+        m -- Integer number of rows in a
+        schedule -- Schedule to record the operations in
+        """
+        width = self.u_lower_block
+        if width is None:
+            width = max(1, min(PRECOMPUTATION_BLOCK,
+                               int(math.log(max(2, m - self.l + u), 2)) - 2))
+
+        for start in xrange(self.l - u, self.l, width):
+            end = min(start + width, self.l)
+            for column in xrange(start, end):
+                # Ones in column once a row is reduced by earlier pivots
+                ones = a.column(column, column, m)
+                for pivot in xrange(start, column):
+                    if a.get(pivot, column):
+                        ones ^= a.column(pivot, column, m)
+                rows = numpy.flatnonzero(ones)
+                if not len(rows):
                     raise RaptorR10DecodingScheduleException(
                         "U lower is of less rank than %s." % u
                     )
 
-            # Loop down through rows below column xoring row column
-            for row in xrange(column + 1, m):
-                if a[row][column]:
-                    self.xor_row(a, row, column, schedule)
+                # Reduce the first row found and swap it into place
+                row = int(rows[0]) + column
+                for pivot in xrange(start, column):
+                    if a.get(row, pivot):
+                        self.xor_row(a, row, pivot, schedule)
+                if row != column:
+                    self.exchange_row(a, o_degrees, column, row, schedule)
+
+                # Clear column from the earlier pivots of the block
+                for pivot in xrange(start, column):
+                    if a.get(pivot, column):
+                        self.xor_row(a, pivot, column, schedule)
+
+            # XOR the pivots into the rows below that have a 1
+            block = a.tobool(end, m)[:, start:end]
+            if combination_xors(block) < block.sum():
+                self.xor_combinations(a, numpy.arange(end, m), block, start,
+                                      schedule)
+            else:
+                rows, columns = numpy.nonzero(block)
+                self.xor_pairs(a, rows + end, columns + start, schedule)
 
-        # U upper should now be in upper triangular form. now attack the top
-        for column in xrange(self.l - 1, self.l - u - 1, -1):
-            for row in xrange(i, column):
-                if a[row][column]:
-                    self.xor_row(a, row, column, schedule)
+    def precomputation_blocks(self, u_upper, used=False):
+        """
+        Plans the precomputation of RFC 5053 phases 3 and 4.  The columns
+        of U_upper are split into blocks of b columns.  Every combination
+        of the b rows of U for a block is visited in Gray code order with
+        one XOR each into a scratch row, and each row of U_upper is
+        xored once with the combination matching its ones in the block.
+        The scratch row is cleared between blocks.
 
-        # Discard any rows left after l
-        a = a[:self.l]
-        # a should now be l x l
+        Block widths of 1 to PRECOMPUTATION_BLOCK columns are tried and
+        the cheapest is kept.  Blocks cheaper to xor directly, one row of
+        U per one, are not precomputed.
 
-        # XOR to get rid of 1s in U_Upper
-        for row in xrange(i):
-            for column in xrange(self.l - u, self.l):
-                if a[row][column]:
-                    self.xor_row(a, row, column, schedule)
+        Arguments:
+        u_upper -- 2D numpy bool array of the first i rows of U
 
-        return schedule
+        Keyword Arguments:
+        used -- Boolean the scratch row needs clearing before first use
+
+        Returns a tuple (list of tuples (first column, end column, Boolean
+        precomputed), integer number of XORs)
+        """
+        if not u_upper.size:
+            return [], 0
+
+        best = None
+        for width in xrange(1, PRECOMPUTATION_BLOCK + 1):
+            blocks = []
+            total = 0
+            for start in xrange(0, u_upper.shape[1], width):
+                block = u_upper[:, start:start + width]
+                direct = int(block.sum())
+                precomputed = combination_xors(block) + (used or any(
+                    precompute for first, end, precompute in blocks
+                ))
+                if direct > precomputed:
+                    blocks.append((start, start + width, True))
+                    total += precomputed
+                else:
+                    blocks.append((start, start + width, False))
+                    total += direct
+            if best is None or total < best[1]:
+                best = (blocks, total)
+        return best
+
+    def precompute_u_upper(self, a, u_upper, blocks, schedule):
+        """
+        Clears U_upper as planned by precomputation_blocks
+
+        Arguments:
+        a -- BitMatrix representing a
+        u_upper -- 2D numpy bool array of the first i rows of U
+        blocks -- List of tuples (first column, end column, Boolean
+            precomputed)
+        schedule -- Schedule to record the operations in
+        """
+        first = self.l - u_upper.shape[1]
+        for start, end, precomputed in blocks:
+            block = u_upper[:, start:end]
+            if precomputed:
+                self.xor_combinations(a, numpy.arange(len(block)), block,
+                                      first + start, schedule)
+            else:
+                rows, columns = numpy.nonzero(block)
+                self.xor_pairs(a, rows, columns + first + start, schedule)
+
+    def xor_combinations(self, a, rows, block, first, schedule):
+        """
+        XORs into each of rows the rows of a selected by its ones in
+        block.  Every combination needed is built once in the scratch row
+        of the schedule, visiting them in Gray code order so each costs
+        one XOR, and is xored into the rows needing it
+
+        Arguments:
+        a -- BitMatrix representing a
+        rows -- numpy array of integer target rows
+        block -- 2D numpy bool array with a row for each of rows.  Column
+            n selects row first + n of a
+        first -- Integer row of a selected by the first column of block
+        schedule -- Schedule to record the operations in
+        """
+        # The schedule's only scratch row, cleared if used before
+        if schedule.temps:
+            temp = len(schedule.d)
+            schedule.clear(temp)
+            self.stats['xors'] += 1
+        else:
+            temp = schedule.temp()
+
+        # Rows in the order their combination comes up
+        ranks = gray_ranks(block)
+        order = numpy.argsort(ranks, kind='mergesort')
+        bounds = numpy.searchsorted(ranks[order],
+                                    numpy.arange(ranks.max() + 2))
+        for n in xrange(1, ranks.max() + 1):
+            bit = (n & -n).bit_length() - 1
+            schedule.accumulate(temp, first + bit)
+            for row in rows[order[bounds[n]:bounds[n + 1]]].tolist():
+                schedule.release(row, temp)
+        self.stats['xors'] += combination_xors(block)
+
+        targets, columns = numpy.nonzero(block)
+        a.xor_pairs(rows[targets], columns + first)
 
     def a(self):
         """
         Calculates the matrix a by constructing the submatrices
         and appending them together
 
-        Returns a list of bitarrays representing a
+        Returns a BitMatrix representing a
         """
+        words = numpy.vstack([self.precode_rows(), self.lt_rows()])
+        return BitMatrix(len(words), self.l, words)
 
-        # Init a to the empty list
-        a = []
+    def precode_rows(self):
+        """
+        The ldpc and hdpc sections packed into words.  They depend only
+        upon k so they are built once per k and shared through
+        PRECODE_CACHE
 
-        # Create the ldpc section
-        a.extend(self.ldpc_section())
+        Returns a read only numpy array of (s + h) rows of uint64 words
+        """
+        words = PRECODE_CACHE.get(self.k)
+        if words is None:
+            words = bitmatrix.pack(numpy.vstack((self.ldpc_bits(),
+                                                 self.hdpc_bits())))
+            words.flags.writeable = False
+            PRECODE_CACHE.put(self.k, words)
+        return words
+
+    def ldpc_bits(self):
+        """
+        Builds the ldpc section as a numpy array
+        (s x k)ldpc | (s x s)identity | (s x h)zero matrix
 
-        # Create the hdpc section
-        a.extend(self.hdpc_section())
+        Returns a 2D numpy bool array of s x l
+        """
+        bits = numpy.zeros((self.s, self.l), dtype=bool)
+        i = numpy.arange(self.k)
+        a = 1 + (i // self.s) % (self.s - 1)
+        b = i % self.s
+        for j in xrange(3):
+            bits[b, i] = True
+            b = (b + a) % self.s
+        bits[:, self.k:self.k + self.s] = numpy.eye(self.s, dtype=bool)
+        return bits
+
+    def hdpc_bits(self):
+        """
+        Builds the hdpc section as a numpy array.  Bit h of the j'th gray
+        code with h_prime bits set is row h of column j
+        (h x (k + s)) half | (h x h)identity
+
+        Returns a 2D numpy bool array of h x l
+        """
+        columns = self.k + self.s
+        grays = numpy.array(gray.SEQUENCE[self.h_prime][:columns],
+                            dtype='int64')
+        bits = numpy.zeros((self.h, self.l), dtype=bool)
+        bits[:, :columns] = (grays >> numpy.arange(self.h)[:, None]) & 1
+        bits[:, columns:] = numpy.eye(self.h, dtype=bool)
+        return bits
+
+    def lt_rows(self):
+        """
+        Packs the lt section into words
 
-        # Create the lt section
-        a.extend(self.lt_section())
-        return a
+        Returns a numpy array of rows of uint64 words, one per symbol
+        """
+        return self.lt_words([esi for esi, symbol in self.symbols])
 
     def ldpc_section(self):
         m = []
@@ -565,17 +1561,7 @@ class RaptorR10(object):
         # ba[n] will be k1 if and only if c[b] is used in the xoring of LTEnc
         ba = bitarray(self.l)
         ba.setall(False)
-        d, a, b = self.triple(esi)
-
-        while b >= self.l:
-            b = (b + a) % self.l_prime
-
-        ba[b] = True
-
-        for j in xrange(1, min(d, self.l)):
-            b = (b + a) % self.l_prime
-            while b >= self.l:
-                b = (b + a) % self.l_prime
+        for b in self.neighbors(esi).tolist():
             ba[b] = True
         return ba
 
@@ -585,6 +1571,8 @@ class RaptorR10(object):
 
         Returns true for success, false otherwise
         """
+        if self.has_all_sources():
+            return True
         try:
             a = self.a()
             self.decoding_schedule(a)
@@ -600,26 +1588,85 @@ class RaptorR10(object):
         calculating the schedule as normal in an effort to reduce
         the number of XORs.
 
-        Makes a single pass comparing rows to other rows and determining
-        if the xoring of two rows results in less ones.
+        Makes a single pass comparing rows to later rows and xoring a row
+        into a later row when that leaves the later row with at least 3
+        fewer ones.
+
+        Only pairs that can qualify are compared.  Row j can only lose 3
+        ones from row i if they share more than half of row i's ones, so
+        j must have a one in at least one of the columns of i left after
+        dropping that many.  Candidates come from per column lists of
+        rows using the columns of i with the shortest lists.
+
+        The number of pairs compared is capped by prepass_budget per row
+        of a.  Stats record the pairs compared, the XORs made, the ones
+        they removed from a and the estimated XORs saved (ones removed
+        less XORs made).
 
         Arguments:
-        a - List of bitarrays representing matrix a
+        a - BitMatrix representing matrix a
         schedule - Schedule of operations recorded on a to mimic on
             encoded symbols
         """
+        self.stats.update({"prepass_pairs": 0, "prepass_xors": 0,
+                           "prepass_ones_removed": 0, "prepass_saved": 0})
+
+        budget = None
+        if self.prepass_budget is not None:
+            budget = self.prepass_budget * len(a)
+
+        # Columns with a one in each row and rows with a one in each column
+        ones, index = index_ones(a)
+        counts = a.counts()
 
         # Iterate over rows in a
         for i in xrange(len(a)):
 
-            # Iterate over remaining rows in a
-            for j in xrange(i + 1, len(a)):
-                count = a[j].count()
-                new_row = a[i] ^ a[j]
+            # Row j qualifies when it shares at least needed ones with i
+            columns = list(ones[i])
+            needed = (len(columns) + 2) // 2 + 1
+            if needed > len(columns):
+                continue
+
+            columns.sort(key=lambda column: len(index[column]))
+            candidates = set()
+            for column in columns[:len(columns) - needed + 1]:
+                candidates.update(index[column])
+            candidates = numpy.array(sorted(candidates), dtype='int64')
+            candidates = candidates[candidates > i]
+            if not len(candidates):
+                continue
+
+            if budget is not None:
+                if budget <= 0:
+                    break
+                candidates = candidates[:budget]
+                budget -= len(candidates)
+            self.stats['prepass_pairs'] += len(candidates)
+
+            # Check requirements prior to proceeding with XOR
+            new_counts = bitmatrix.popcount(a.words[candidates] ^ a.words[i])
+            better = new_counts + 2 < counts[candidates]
+            rows = candidates[better]
+            if not len(rows):
+                continue
+
+            self.stats['prepass_xors'] += len(rows)
+            self.stats['prepass_ones_removed'] += int(
+                (counts[rows] - new_counts[better]).sum()
+            )
+            counts[rows] = new_counts[better]
+            self.xor_rows(a, rows, i, schedule)
 
-                # Check requirements prior to proceeding with XOR
-                if new_row.count() + 2 < count:
-                    self.xor_row(a, j, i, schedule)
+            # The xored rows flipped in every column of row i
+            rows = rows.tolist()
+            for column in columns:
+                index[column].symmetric_difference_update(rows)
+            for row in rows:
+                ones[row] ^= ones[i]
+
+        self.stats['prepass_saved'] = \
+            self.stats['prepass_ones_removed'] - self.stats['prepass_xors']
 
     def xor_row(self, a, r1, r2, schedule):
 
@@ -628,35 +1675,80 @@ class RaptorR10(object):
         within the schedule
 
         Arguments:
-        a -- List of l sized bitarrays
+        a -- BitMatrix representing a
         r1 -- Integer target row id
         r2 -- Integer source row id
         schedule -- Schedule to record the operation in
         """
         # XOR r2 of a into r1 of a
-        a[r1] ^= a[r2]
+        a.xor_row(r1, r2)
 
         # Schedule the xor
         schedule.xor(r1, r2)
 
         self.stats['xors'] += 1
 
+    def xor_rows(self, a, rows, r2, schedule):
+
+        """
+        XORS r2 into every row in rows and records the operations
+        within the schedule in order
+
+        Arguments:
+        a -- BitMatrix representing a
+        rows -- Sequence of integer target row ids (must not contain r2)
+        r2 -- Integer source row id
+        schedule -- Schedule to record the operations in
+        """
+        if not len(rows):
+            return
+
+        # XOR r2 of a into every row of a in one pass
+        a.xor_rows(rows, r2)
+
+        # Schedule the xors
+        for r1 in rows.tolist():
+            schedule.xor(r1, r2)
+
+        self.stats['xors'] += len(rows)
+
+    def xor_pairs(self, a, rows, sources, schedule):
+
+        """
+        XORS sources[n] into rows[n] for every n and records the
+        operations within the schedule in order
+
+        Arguments:
+        a -- BitMatrix representing a
+        rows -- Sequence of integer target row ids
+        sources -- Sequence of integer source row ids. No source may
+            also be a target
+        schedule -- Schedule to record the operations in
+        """
+        if not len(rows):
+            return
+
+        a.xor_pairs(rows, sources)
+
+        for r1, r2 in zip(rows.tolist(), sources.tolist()):
+            schedule.xor(r1, r2)
+
+        self.stats['xors'] += len(rows)
+
     def exchange_column(self, a, c1, c2, schedule):
         """
         Exchanges column c1 of a with column c2 of a and records the operation
-        in the schedule
+        in the schedule.  Columns of a are addressed through a column map
+        mirroring schedule.c so no bits are moved
 
         Arguments:
-        a -- List of bit arrays representing a
+        a -- BitMatrix representing a
         c1 -- Integer first column id
         c2 -- Integer second column id
         schedule -- Schedule of operations performed upon a
         """
         # Exchange the columns c1 and c2 in a
-        for i in xrange(len(a)):
-            temp = a[i][c1]
-            a[i][c1] = a[i][c2]
-            a[i][c2] = temp
+        a.exchange_columns(c1, c2)
 
         # Record the operation
         schedule.exchange_column(c1, c2)
@@ -669,16 +1761,14 @@ class RaptorR10(object):
         in the schedule
 
         Arguments:
-        a -- list of bitarrays representing a
+        a -- BitMatrix representing a
         o_degrees -- List of original degrees of rows
         r1 -- Integer id of first row to exchange
         r2 -- Integer id of second row to exchange
         schedule -- Schedule to record the operation in
         """
         # Exchange r1 with r2 of a
-        temp = a[r1]
-        a[r1] = a[r2]
-        a[r2] = temp
+        a.exchange_rows(r1, r2)
 
         temp = o_degrees[r1]
         o_degrees[r1] = o_degrees[r2]
@@ -762,6 +1852,32 @@ class RaptorR10(object):
         """
         numpy.bitwise_xor(source, target, target)
 
+    @classmethod
+    def xor_fused(cls, symbols, rows, target):
+        """
+        XORs several rows of symbols together into target.  Rather than
+        passing over the whole target once per row, the rows are combined
+        a tile of XOR_TILE bytes at a time so the tile of target stays in
+        cache.  Each row is read once and target is written once
+
+        Arguments:
+        symbols -- 2D numpy array of symbols
+        rows -- Sequence of integer rows of symbols, at least one
+        target -- Numpy array to hold the XOR of the rows
+        """
+        rows = [int(row) for row in rows]
+        size = max(1, XOR_TILE // symbols.itemsize)
+        for start in xrange(0, len(target), size):
+            tile = slice(start, start + size)
+            out = target[tile]
+            if len(rows) == 1:
+                out[...] = symbols[rows[0], tile]
+                continue
+            numpy.bitwise_xor(symbols[rows[0], tile],
+                              symbols[rows[1], tile], out)
+            for row in rows[2:]:
+                numpy.bitwise_xor(out, symbols[row, tile], out)
+
     def gen_optimal_symbols(self, how_many):
         """
         Used in generating the sequences of optimal symbols.
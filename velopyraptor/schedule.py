@@ -13,6 +13,11 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import heapq
+from collections import OrderedDict
+from itertools import combinations
+
+import numpy
 
 
 class Schedule(object):
@@ -39,6 +44,9 @@ class Schedule(object):
         # Init xors to empty list
         self.xors = []
 
+        # Scratch rows appended after the m rows of D by optimize
+        self.temps = 0
+
     def xor(self, r1, r2):
         """
         Indicates r2 is xored into r1.  Appends a tuple(d[r2], d[r1])
@@ -51,6 +59,45 @@ class Schedule(object):
         """
         self.xors.append((self.d[r2], self.d[r1]))
 
+    def temp(self):
+        """
+        Adds a scratch row to the rows of D.  Scratch rows start out as
+        zeros and follow the m rows of D
+
+        Returns the integer index of the scratch row in D
+        """
+        self.temps += 1
+        return len(self.d) + self.temps - 1
+
+    def accumulate(self, temp, r):
+        """
+        Indicates row r is xored into scratch row temp
+
+        Arguments:
+        temp -- Integer scratch row index in D
+        r -- Integer row of the matrix
+        """
+        self.xors.append((self.d[r], temp))
+
+    def release(self, r, temp):
+        """
+        Indicates scratch row temp is xored into row r
+
+        Arguments:
+        r -- Integer row of the matrix
+        temp -- Integer scratch row index in D
+        """
+        self.xors.append((temp, self.d[r]))
+
+    def clear(self, temp):
+        """
+        Indicates scratch row temp is cleared by xoring it into itself
+
+        Arguments:
+        temp -- Integer scratch row index in D
+        """
+        self.xors.append((temp, temp))
+
     def exchange_row(self, r1, r2):
         """
         Indicates row r1 is swapped with row r2
@@ -76,3 +123,224 @@ class Schedule(object):
         swap = self.c[c1]
         self.c[c1] = self.c[c2]
         self.c[c2] = swap
+
+    def waves(self):
+        """
+        Splits the xors into waves of XORs that can be applied at the
+        same time.  An XOR goes in the wave after the last one writing its
+        source or target, and no earlier than the last wave reading its
+        target.  Every row is a target at most once per wave and a row
+        read and written in the same wave is read before it is written,
+        as it is by the XORs in order
+
+        Returns a list of tuples (numpy array of sources, numpy array of
+        targets)
+        """
+        rows = len(self.d) + self.temps
+        written = [-1] * rows
+        read = [0] * rows
+        levels = []
+        append = levels.append
+        for source, target in self.xors:
+            level = written[target] + 1
+            if written[source] >= level:
+                level = written[source] + 1
+            if read[target] > level:
+                level = read[target]
+            written[target] = level
+            if read[source] < level:
+                read[source] = level
+            append(level)
+
+        if not levels:
+            return []
+        xors = numpy.array(self.xors, dtype='int64').reshape(-1, 2)
+        order = numpy.argsort(levels, kind='mergesort')
+        xors = xors[order]
+        bounds = numpy.flatnonzero(numpy.diff(
+            numpy.array(levels, dtype='int64')[order]
+        )) + 1
+        return [(wave[:, 0], wave[:, 1])
+                for wave in numpy.split(xors, bounds)]
+
+    def optimize(self, max_temps=None):
+        """
+        Compiles the list of xors before it is applied to any symbols.
+
+        XORs that only feed rows outside of d[0..L-1] are dropped.  The
+        remaining XORs are split into runs in which no target is also a
+        source, so the XORs of a run can be applied in any order.  Within
+        a run repeated XORs cancel and pairs of sources shared by several
+        targets are combined once into a scratch row which is xored into
+        those targets instead.
+
+        Scratch rows follow any already in use and are reused by later
+        runs after being cleared by xoring them into themselves.
+        self.temps is raised by the number of scratch rows needed.
+
+        Keyword Arguments:
+        max_temps -- Integer maximum number of scratch rows. None for no
+            limit
+
+        Returns a dictionary with the number of XORs removed as dead,
+        cancelled and shared
+        """
+        live = self.live_xors()
+        removed = {"dead": len(self.xors) - len(live),
+                   "cancelled": len(live), "shared": 0}
+
+        xors = []
+        first = len(self.d) + self.temps
+        temps = 0
+        for run in self.runs(live):
+            size = sum(len(sources) for sources in run.itervalues())
+            removed["cancelled"] -= size
+            removed["shared"] += size
+
+            # Build the scratch rows, clearing any left by earlier runs
+            shared = self.share(run, first, temps, max_temps)
+            for slot, (s1, s2) in enumerate(shared):
+                row = first + slot
+                if slot < temps:
+                    xors.append((row, row))
+                xors.append((s1, row))
+                xors.append((s2, row))
+            temps = max(temps, len(shared))
+
+            for target, sources in run.iteritems():
+                for source in sorted(sources):
+                    xors.append((source, target))
+
+        removed["shared"] -= len(xors)
+        self.xors = xors
+        self.temps += temps
+        return removed
+
+    def slice(self, rows):
+        """
+        Copies the schedule keeping only the XORs that rows of D depend on
+
+        Arguments:
+        rows -- Iterable of integer rows of D
+
+        Returns a Schedule with the same c, d and scratch rows
+        """
+        schedule = Schedule(0, 0)
+        schedule.c = list(self.c)
+        schedule.d = list(self.d)
+        schedule.temps = self.temps
+        schedule.xors = self.live_xors(rows)
+        return schedule
+
+    def live_xors(self, rows=None):
+        """
+        Walks the xors backwards from the rows d[0..L-1] keeping only
+        the XORs whose result is eventually read by one of them.  A row
+        xored into itself is cleared, so its earlier value is not needed
+
+        Keyword Arguments:
+        rows -- Iterable of integer rows of D to walk back from.  None for
+            the rows d[0..L-1]
+
+        Returns a list of tuples (source, target)
+        """
+        if rows is None:
+            rows = self.d[:len(self.c)]
+        live = set(rows)
+        xors = []
+        for source, target in reversed(self.xors):
+            if target in live:
+                xors.append((source, target))
+                if source == target:
+                    live.discard(target)
+                else:
+                    live.add(source)
+        xors.reverse()
+        return xors
+
+    def runs(self, xors):
+        """
+        Splits xors into runs in which no target is also a source.
+        Repeated XORs within a run cancel.  A row xored into itself is a
+        run of its own
+
+        Arguments:
+        xors -- List of tuples (source, target)
+
+        Returns a generator of OrderedDicts of target to set of sources
+        """
+        run = OrderedDict()
+        sources = set()
+        for source, target in xors:
+            if source == target or source in run or target in sources:
+                if run:
+                    yield run
+                run = OrderedDict()
+                sources = set()
+            if source == target:
+                yield OrderedDict([(target, set([source]))])
+                continue
+            run.setdefault(target, set()).symmetric_difference_update(
+                [source]
+            )
+            sources.add(source)
+        if run:
+            yield run
+
+    def share(self, run, first, temps, max_temps=None):
+        """
+        Greedily replaces the pair of sources shared by the most targets
+        of run with a scratch row until no pair pays for its scratch row.
+        A new scratch row costs 2 XORs to build and one cleared from an
+        earlier run costs 3.  Scratch rows may themselves be paired.
+
+        Arguments:
+        run   -- OrderedDict of target to set of sources.  Updated in place
+        first -- Integer index in D of the first scratch row
+        temps -- Integer number of scratch rows used by earlier runs
+
+        Keyword Arguments:
+        max_temps -- Integer maximum number of scratch rows. None for no
+            limit
+
+        Returns a list of the pair of sources of each scratch row
+        """
+        pairs = {}
+        for target, sources in run.iteritems():
+            for pair in combinations(sorted(sources), 2):
+                pairs.setdefault(pair, set()).add(target)
+        heap = [(-len(targets), pair) for pair, targets in pairs.iteritems()
+                if len(targets) > 2]
+        heapq.heapify(heap)
+
+        shared = []
+        while heap and (max_temps is None or len(shared) < max_temps):
+            count, pair = heapq.heappop(heap)
+            targets = pairs.get(pair, ())
+            if len(targets) != -count:
+                if len(targets) > 2:
+                    heapq.heappush(heap, (-len(targets), pair))
+                continue
+            if -count <= (3 if len(shared) < temps else 2):
+                break
+
+            row = first + len(shared)
+            shared.append(pair)
+            touched = set()
+            for target in targets:
+                sources = run[target]
+                sources.difference_update(pair)
+                for source in sources:
+                    for old in pair:
+                        pairs[min(old, source), max(old, source)].discard(
+                            target
+                        )
+                    pairs.setdefault((source, row), set()).add(target)
+                    touched.add((source, row))
+                sources.add(row)
+            del pairs[pair]
+
+            for key in touched:
+                if len(pairs[key]) > 2:
+                    heapq.heappush(heap, (-len(pairs[key]), key))
+        return shared
@@ -143,7 +143,7 @@ class StringDecoder(RaptorR10):
         Return the original string
         """
         # Check the i symbols
-        if not self.i_symbols:
+        if self.i_symbols is None:
             return None
 
         # Assemble the first k source symbols into one string
@@ -0,0 +1,134 @@
+import os
+import sys
+import unittest
+
+from bitarray import bitarray
+
+# Parent holds the encoding/decoding python files
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bitmatrix
+from bitmatrix import BitMatrix
+
+
+class TestBitMatrix(unittest.TestCase):
+
+    def sample(self):
+        """
+        Creates a 3 x 70 matrix that spans more than one word
+
+        Returns a tuple (list of bitarrays, BitMatrix)
+        """
+        rows = [bitarray('10' * 35), bitarray('0' * 69 + '1'),
+                bitarray('1' * 70)]
+        return rows, BitMatrix.from_bitarrays(rows)
+
+    def test_round_trip(self):
+        """
+        Tests packing bitarrays into words and back out again
+        """
+        rows, m = self.sample()
+        self.assertTrue(m.rows == 3)
+        self.assertTrue(m.columns == 70)
+        self.assertTrue(m.width == 2)
+        self.assertTrue(m.tobitarrays() == rows)
+
+    def test_get_set(self):
+        """
+        Tests getting and setting single bits
+        """
+        rows, m = self.sample()
+        for row in xrange(len(rows)):
+            for column in xrange(70):
+                self.assertTrue(m.get(row, column) == rows[row][column])
+
+        m.set(1, 65)
+        self.assertTrue(m.get(1, 65))
+        m.set(1, 65, False)
+        self.assertFalse(m.get(1, 65))
+
+    def test_counts(self):
+        """
+        Tests popcounts of rows with and without a mask
+        """
+        rows, m = self.sample()
+        self.assertTrue(m.count(2) == 70)
+        self.assertTrue(m.counts().tolist() == [35, 1, 70])
+
+        mask = bitmatrix.range_mask(70, 60, 70)
+        self.assertTrue(m.counts(1, 3, mask).tolist() == [1, 10])
+
+    def test_column_and_ones(self):
+        """
+        Tests extracting columns and the set columns of a row
+        """
+        rows, m = self.sample()
+        self.assertTrue(m.column(69).tolist() == [False, True, True])
+        self.assertTrue(m.rows_with(0, 1).tolist() == [2])
+        self.assertTrue(m.ones(0, 60).tolist() == [60, 62, 64, 66, 68])
+
+    def test_xor_rows(self):
+        """
+        Tests XORing one row into several others
+        """
+        rows, m = self.sample()
+        m.xor_rows([1, 2], 0)
+        self.assertTrue(m.tobitarrays()[1] == rows[1] ^ rows[0])
+        self.assertTrue(m.tobitarrays()[2] == rows[2] ^ rows[0])
+
+    def test_exchange(self):
+        """
+        Tests exchanging rows and columns
+        """
+        rows, m = self.sample()
+        m.exchange_rows(0, 2)
+        self.assertTrue(m.tobitarrays() == [rows[2], rows[1], rows[0]])
+
+        m.exchange_columns(0, 69)
+        self.assertTrue(m.column(0).tolist() == [True, True, False])
+        self.assertTrue(m.column(69).tolist() == [True, False, True])
+
+    def test_exchange_columns_is_logical(self):
+        """
+        Tests that exchanging columns only changes the column map and that
+        ones and masks follow logical columns
+        """
+        rows, m = self.sample()
+        words = m.words.copy()
+        m.exchange_columns(1, 69)
+        self.assertTrue((m.words == words).all())
+        self.assertTrue(m.ones(1).tolist() == [1])
+        self.assertTrue(m.count(1, m.mask(0, 2)) == 1)
+        self.assertTrue(m.count(0, m.mask(0, 2)) == 1)
+        self.assertTrue(m.count(2, m.mask(0, 2)) == 2)
+        self.assertTrue(m.tobitarrays()[1] == bitarray('01' + '0' * 68))
+
+
+class TestBasis(unittest.TestCase):
+
+    def test_rank(self):
+        """
+        Tests that dependent rows do not increase the rank
+        """
+        rows = BitMatrix.from_bitarrays([bitarray('1100'), bitarray('0110'),
+                                         bitarray('1010'), bitarray('0001')])
+        basis = bitmatrix.Basis(4)
+        self.assertTrue(basis.add(rows.words[0]))
+        self.assertTrue(basis.add(rows.words[1]))
+
+        # Row 2 is row 0 ^ row 1
+        self.assertFalse(basis.add(rows.words[2]))
+        self.assertTrue(basis.add(rows.words[3]))
+        self.assertTrue(basis.rank == 3)
+
+    def test_reduce(self):
+        """
+        Tests that rows in the row space reduce to zero
+        """
+        rows = BitMatrix.from_bitarrays([bitarray('1' * 70),
+                                         bitarray('01' * 35)])
+        basis = bitmatrix.Basis(70)
+        basis.add(rows.words[0])
+        basis.add(rows.words[1])
+        combined = rows.words[0] ^ rows.words[1]
+        self.assertFalse(basis.reduce(combined).any())
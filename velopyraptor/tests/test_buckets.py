@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+# Parent holds the encoding/decoding python files
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from buckets import DegreeBuckets
+
+
+class TestDegreeBuckets(unittest.TestCase):
+
+    def test_minimum(self):
+        """
+        Tests that the minimum ignores rows of degree 0 and rows
+        before start
+        """
+        buckets = DegreeBuckets([1, 0, 3, 2, 2], start=1)
+        self.assertTrue(buckets.minimum() == (2, set([3, 4])))
+        self.assertFalse(0 in buckets)
+
+    def test_update(self):
+        """
+        Tests that the minimum follows degree updates in both directions
+        """
+        buckets = DegreeBuckets([3, 2, 2])
+        buckets.update(1, 1)
+        self.assertTrue(buckets.minimum() == (1, set([1])))
+        buckets.update(1, 4)
+        self.assertTrue(buckets.minimum() == (2, set([2])))
+        buckets.remove(2)
+        self.assertTrue(buckets.minimum() == (3, set([0])))
+
+    def test_exchange(self):
+        """
+        Tests exchanging the degrees of two rows
+        """
+        buckets = DegreeBuckets([3, 1])
+        buckets.exchange(0, 1)
+        self.assertTrue(buckets.degree(0) == 1)
+        self.assertTrue(buckets.degree(1) == 3)
+
+    def test_empty(self):
+        """
+        Tests the minimum when every row has degree 0
+        """
+        buckets = DegreeBuckets([0, 0])
+        self.assertTrue(buckets.minimum() == (None, set()))
+        buckets.update(0, 5)
+        self.assertTrue(buckets.minimum() == (5, set([0])))
@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+# Parent holds the encoding/decoding python files
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction(self):
+        """
+        Tests that the least recently used entry is evicted
+        """
+        c = LRUCache(2)
+        c.put(1, 'a')
+        c.put(2, 'b')
+        self.assertTrue(c.get(1) == 'a')
+        c.put(3, 'c')
+        self.assertFalse(2 in c)
+        self.assertTrue(1 in c)
+        self.assertTrue(len(c) == 2)
+
+    def test_default(self):
+        """
+        Tests the default returned for missing keys
+        """
+        c = LRUCache(1)
+        self.assertTrue(c.get(1) is None)
+        self.assertTrue(c.get(1, 5) == 5)
+        self.assertFalse(1 in c)
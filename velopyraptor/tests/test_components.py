@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+# Parent holds the encoding/decoding python files
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from components import Components
+
+
+class TestComponents(unittest.TestCase):
+
+    def test_empty(self):
+        """
+        Tests that no row is returned without edges
+        """
+        self.assertTrue(Components().largest() is None)
+
+    def test_largest(self):
+        """
+        Tests that a row from the component with the most edges
+        is returned
+        """
+        c = Components()
+        c.add(10, 0, 1)
+        c.add(11, 5, 6)
+        c.add(12, 6, 7)
+        c.add(13, 7, 5)
+        self.assertTrue(c.largest() in (11, 12, 13))
+
+    def test_remove_splits(self):
+        """
+        Tests that removing an edge splits its component
+        """
+        c = Components()
+        c.add(1, 0, 1)
+        c.add(2, 1, 2)
+        c.add(3, 2, 3)
+        c.add(4, 7, 8)
+        c.add(5, 8, 9)
+
+        # 0-1 | 2-3 is left, the largest component is now 7-8-9
+        c.remove(2)
+        self.assertTrue(c.largest() in (4, 5))
+        self.assertFalse(2 in c)
+
+    def test_exchange(self):
+        """
+        Tests that exchanging rows moves their edges
+        """
+        c = Components()
+        c.add(1, 0, 1)
+        c.exchange(1, 4)
+        self.assertFalse(1 in c)
+        self.assertTrue(c.largest() == 4)
@@ -0,0 +1,166 @@
+import os
+import sys
+import unittest
+
+import numpy
+
+# Parent holds the encoding/decoding python files
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from decoder import Decoder
+from encoder import Encoder
+from raptor import RaptorR10DecodingScheduleException
+
+K = 10
+
+
+class TestDecoder(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Encodes k random source symbols, the same on every run
+        """
+        random = numpy.random.RandomState(0)
+        self.source = [random.randint(0, 1 << 30, 4).astype(config.dtype)
+                       for i in xrange(K)]
+        self.encoder = Encoder(K, [(i, s.copy()) for i, s in
+                                   enumerate(self.source)])
+
+    def test_append_reports_rank(self):
+        """
+        Tests that append reports decodability only once A has full rank
+        and that decoding before then fails without losing symbols
+        """
+        decoder = Decoder(K)
+        decoder.append((K, self.encoder.ltenc(K)))
+        with self.assertRaises(RaptorR10DecodingScheduleException):
+            decoder.decode()
+
+        esi = K + 1
+        while not decoder.append((esi, self.encoder.ltenc(esi))):
+            esi += 1
+        self.assertTrue(decoder.basis.rank == decoder.l)
+
+        decoder.decode()
+        for i in xrange(K):
+            self.assertTrue((decoder.ltenc(i) == self.source[i]).all())
+
+    def test_duplicates(self):
+        """
+        Tests that a repeated symbol does not count towards the rank
+        """
+        decoder = Decoder(K)
+        decoder.append((0, self.source[0]))
+        rank = decoder.basis.rank
+        decoder.append((0, self.source[0]))
+        self.assertTrue(decoder.basis.rank == rank)
+
+    def test_sources_pass_through(self):
+        """
+        Tests that received source symbols need no decoding and are
+        returned untouched
+        """
+        decoder = Decoder(K)
+        for i in xrange(K):
+            decoder.append((i, self.source[i]))
+        decoder.decode()
+        self.assertTrue(decoder.i_symbols is None)
+        for i in xrange(K):
+            self.assertTrue(decoder.next()[1] is self.source[i])
+
+    def test_missing_source(self):
+        """
+        Tests that a missing source symbol is decoded while the others
+        pass through
+        """
+        decoder = Decoder(K)
+        for i in xrange(1, K):
+            decoder.append((i, self.source[i]))
+        esi = K
+        while not decoder.append((esi, self.encoder.ltenc(esi))):
+            esi += 1
+        decoder.decode()
+        esi, symbol = decoder.next()
+        self.assertTrue((symbol == self.source[0]).all())
+        for i in xrange(1, K):
+            self.assertTrue(decoder.next()[1] is self.source[i])
+
+    def test_decode_symbols(self):
+        """
+        Tests that decoding a few symbols matches decoding all of them
+        """
+        decoder = Decoder(K)
+        for i in xrange(3, K):
+            decoder.append((i, self.source[i]))
+        esi = K
+        while not decoder.append((esi, self.encoder.ltenc(esi))):
+            esi += 1
+        symbols = decoder.decode_symbols([1, 5, K + 20])
+        self.assertTrue(decoder.i_symbols is None)
+        self.assertTrue((symbols[0] == self.source[1]).all())
+        self.assertTrue((symbols[1] == self.source[5]).all())
+        self.assertTrue((symbols[2] == self.encoder.ltenc(K + 20)).all())
+
+    def test_choose(self):
+        """
+        Tests that repeated ids are dropped and that source symbols come
+        before repair symbols of increasing degree
+        """
+        decoder = Decoder(K)
+        esis = [K + 5, 2, K + 1, K + 5, K + 9, 7, 2]
+        self.assertTrue(sorted(decoder.preferred(esis)) == [2, 7, K + 1,
+                                                            K + 5, K + 9])
+        degrees = decoder.triples(decoder.preferred(esis)[2:])[0].tolist()
+        self.assertTrue(decoder.preferred(esis)[:2] == [2, 7])
+        self.assertTrue(degrees == sorted(degrees))
+
+        for esi in esis:
+            decoder.symbols.append((esi, self.encoder.ltenc(esi)))
+        chosen = decoder.choose(8)
+        self.assertTrue(len(chosen) == 5)
+        self.assertTrue([decoder.symbols[n][0] for n in chosen] ==
+                        decoder.preferred(esis))
+
+        esi = K + 10
+        while not decoder.append((esi, self.encoder.ltenc(esi))):
+            esi += 1
+
+        # K + 5 and 2 were appended twice above, esi is appended again
+        decoder.append((esi, self.encoder.ltenc(esi)))
+        decoder.decode()
+        self.assertTrue(decoder.stats['repeated_symbols'] == 3)
+        for i in xrange(K):
+            self.assertTrue((decoder.ltenc(i) == self.source[i]).all())
+
+    def test_choose_reserve(self):
+        """
+        Tests that only k plus an overhead of the cheapest symbols are
+        chosen and that the reserve is drawn on when decoding fails
+        """
+        decoder = Decoder(K)
+        esis = range(K + 1, 3 * K)
+        for esi in esis:
+            decoder.append((esi, self.encoder.ltenc(esi)))
+        chosen = decoder.choose(overhead=2)
+        self.assertTrue([decoder.symbols[n][0] for n in chosen] ==
+                        decoder.preferred(esis)[:K + 2])
+
+        calls = []
+
+        def fail_once():
+            calls.append(len(decoder.symbols))
+            if len(calls) == 1:
+                raise RaptorR10DecodingScheduleException("rank")
+            decoder.calculate_i_symbols()
+        decoder.with_chosen(fail_once)
+        self.assertTrue(len(calls) == 2 and calls[0] < calls[1])
+        self.assertTrue(decoder.stats['choose_retries'] == 1)
+        self.assertTrue(decoder.stats['chosen_symbols'] +
+                        decoder.stats['reserve_symbols'] == len(esis))
+        self.assertTrue(len(decoder.symbols) == len(esis))
+
+        def fail():
+            raise RaptorR10DecodingScheduleException("rank")
+        with self.assertRaises(RaptorR10DecodingScheduleException):
+            decoder.with_chosen(fail)
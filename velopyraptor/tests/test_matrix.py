@@ -175,3 +175,58 @@ class TestMatrix(unittest.TestCase):
              bitarray("00000"),
              bitarray("00001")]
         self.assertTrue(matrix.rank(m) == 2)
+
+    def test_rank_missing_pivot(self):
+        """
+        Tests the rank of a matrix whose first column is all zeros
+        """
+        m = [bitarray("011"), bitarray("010"), bitarray("001")]
+        self.assertTrue(matrix.rank(m) == 2)
+
+    def test_ranks(self):
+        """
+        Tests that the ranks of a batch match the rank of each matrix
+        """
+        batch = [[bitarray("110"), bitarray("011"), bitarray("101")],
+                 [bitarray("100"), bitarray("010"), bitarray("001")],
+                 [bitarray("000"), bitarray("000"), bitarray("000")]]
+        self.assertTrue(matrix.ranks(batch) == [2, 3, 0])
+        self.assertTrue(matrix.ranks(batch) ==
+                        [matrix.rank(m) for m in batch])
+
+    def test_multiply_wide(self):
+        """
+        Tests multiplying matrices spanning several words against
+        multiplying bit by bit
+        """
+        a = [bitarray(70) for i in xrange(9)]
+        b = [bitarray(130) for i in xrange(70)]
+        c = matrix.multiply(a, b)
+        for i in xrange(9):
+            for j in xrange(130):
+                bit = False
+                for k in xrange(70):
+                    bit ^= a[i][k] & b[k][j]
+                self.assertTrue(c[i][j] == bit)
+
+    def test_transpose(self):
+        """
+        Tests transposing a 2x3 matrix
+        """
+        m = [bitarray("110"), bitarray("001")]
+        self.assertTrue(matrix.transpose(m) ==
+                        [bitarray("10"), bitarray("10"), bitarray("01")])
+
+    def test_solve(self):
+        """
+        Tests solving an overdetermined consistent system and that an
+        inconsistent one raises
+        """
+        a = [bitarray("11"), bitarray("10"), bitarray("01")]
+        x = [bitarray("101"), bitarray("011")]
+        b = matrix.multiply(a, x)
+        self.assertTrue(matrix.solve(a, b) == x)
+
+        b[2] = ~b[2]
+        with self.assertRaises(Exception):
+            matrix.solve(a, b)
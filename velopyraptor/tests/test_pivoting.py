@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+# Parent holds the encoding/decoding python files
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decoder import Decoder
+from pivot_evaluation import evaluate
+from pivoting import STRATEGIES, Pivoting
+from test_raptor import encoded
+
+
+class TestPivoting(unittest.TestCase):
+
+    def test_strategies_decode(self):
+        """
+        Tests that every strategy gives the same intermediate symbols when
+        encoding and when decoding from repair symbols
+        """
+        expected = encoded(120, use_inverse=False)
+        symbols = [(esi, expected.ltenc(esi)) for esi in xrange(40, 200)]
+        for strategy in STRATEGIES.itervalues():
+            encoder = encoded(120, use_inverse=False, pivoting=strategy())
+            self.assertTrue((encoder.i_symbols == expected.i_symbols).all())
+
+            decoder = Decoder(120, [(esi, s.copy()) for esi, s in symbols],
+                              pivoting=strategy())
+            decoder.decode()
+            self.assertTrue((decoder.i_symbols == expected.i_symbols).all())
+
+    def test_evaluate(self):
+        """
+        Tests that the evaluation of the default strategy matches the
+        schedule built by a coder
+        """
+        result = evaluate(200, Pivoting())
+        encoder = encoded(200, 1)
+        self.assertTrue(result["inactivated"] ==
+                        encoder.stats["inactivated"])
+        self.assertTrue(result["applied"] < result["xors"])
+
+        result = evaluate(200, Pivoting(), loss=0.5)
+        self.assertTrue(result["inactivated"] > 0)
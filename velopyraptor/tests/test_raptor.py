@@ -0,0 +1,353 @@
+import os
+import sys
+import threading
+import unittest
+
+import numpy
+from bitarray import bitarray
+
+# Parent holds the encoding/decoding python files
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bitmatrix
+import matrix
+import raptor
+from bitmatrix import BitMatrix
+from decoder import Decoder
+from encoder import BatchEncoder, Encoder, EncoderHard
+from raptor import RaptorR10
+from schedule import Schedule
+
+
+def source_symbols(k, size=3):
+    """
+    Source symbols whose words count up from their id
+
+    Arguments:
+    k -- Integer number of source symbols
+
+    Keyword Arguments:
+    size -- Integer number of words per symbol
+
+    Returns a list of tuples (integer id, numpy array)
+    """
+    return [(i, numpy.arange(i, i + size, dtype='uint64'))
+            for i in xrange(k)]
+
+
+def encoded(k, size=3, **kwargs):
+    """
+    Encodes new source symbols from source_symbols.  Any other keyword
+    arguments are passed to Encoder
+
+    Arguments:
+    k -- Integer number of source symbols
+
+    Keyword Arguments:
+    size -- Integer number of words per symbol
+
+    Returns an Encoder
+    """
+    return Encoder(k, source_symbols(k, size), **kwargs)
+
+
+class TestRaptor(unittest.TestCase):
+
+    def raptor(self, k, **kwargs):
+        """
+        Creates a RaptorR10 with enough symbols to build a schedule
+
+        Arguments:
+        k -- Integer number of source symbols
+        """
+        r = RaptorR10(k, **kwargs)
+        r.symbols = [(esi, numpy.zeros(1, dtype='uint64'))
+                     for esi in xrange(0, 3 * k, 2)]
+        return r
+
+    def all_pairs_prepass(self, a):
+        """
+        The prepass as it was before candidates were indexed, comparing
+        every row to every later row
+
+        Arguments:
+        a -- BitMatrix representing matrix A.  Updated in place
+
+        Returns a list of tuples (source, target) of the XORs made
+        """
+        xors = []
+        for i in xrange(len(a)):
+            counts = a.counts(i + 1)
+            new_counts = bitmatrix.popcount(a.words[i + 1:] ^ a.words[i])
+            rows = numpy.flatnonzero(new_counts + 2 < counts) + i + 1
+            a.words[rows] ^= a.words[i]
+            xors.extend((i, row) for row in rows.tolist())
+        return xors
+
+    def test_prepass_budget(self):
+        """
+        Tests that an unbounded prepass makes the XORs of the all pairs
+        prepass and that a budget that binds stops the prepass early and
+        still decodes
+        """
+        unbounded = self.raptor(40, prepass_budget=None)
+        unbounded.stats = {"xors": 0}
+        a = unbounded.a()
+        schedule = Schedule(unbounded.l, len(a))
+        unbounded.prepass(a, schedule)
+        expected = unbounded.a()
+        self.assertTrue(schedule.xors == self.all_pairs_prepass(expected))
+        self.assertTrue((a.words == expected.words).all())
+        self.assertTrue(unbounded.stats['prepass_xors'] > 0)
+        self.assertTrue(unbounded.stats['prepass_saved'] ==
+                        unbounded.stats['prepass_ones_removed'] -
+                        unbounded.stats['prepass_xors'])
+
+        # 4 pairs per row is fewer than the unbounded prepass compares
+        r = self.raptor(40, prepass_budget=4)
+        a = r.a()
+        r.decoding_schedule(a)
+        self.assertTrue(r.stats['prepass_pairs'] == 4 * len(a))
+        self.assertTrue(r.stats['prepass_pairs'] <
+                        unbounded.stats['prepass_pairs'])
+        self.assertTrue(0 < r.stats['prepass_xors'] <
+                        unbounded.stats['prepass_xors'])
+
+        expected = encoded(40)
+        symbols = [(esi, expected.ltenc(esi)) for esi in xrange(0, 120, 2)]
+        decoder = Decoder(40, symbols, prepass_budget=4)
+        decoder.decode()
+        self.assertTrue((decoder.i_symbols == expected.i_symbols).all())
+
+        r = self.raptor(40, prepass_budget=0)
+        r.decoding_schedule(r.a())
+        self.assertTrue(r.stats['prepass_pairs'] == 0)
+        self.assertTrue(r.stats['prepass_xors'] == 0)
+
+    def test_striped(self):
+        """
+        Tests that striping symbols over worker threads produces the same
+        intermediate and encoded symbols
+        """
+        single = encoded(10, 9)
+        striped = encoded(10, 9, workers=3, stripe_size=16)
+        self.assertTrue((single.i_symbols == striped.i_symbols).all())
+        for esi in xrange(20):
+            self.assertTrue((single.ltenc(esi) == striped.ltenc(esi)).all())
+
+    def test_thread_pools(self):
+        """
+        Tests that coders share one pool per number of workers, also when
+        started from several threads, and that closed pools are replaced
+        """
+        raptor.close_thread_pools()
+        pools = []
+        threads = [threading.Thread(
+            target=lambda: pools.append(raptor.thread_pool(3)))
+            for i in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(len(set(map(id, pools))) == 1)
+
+        raptor.close_thread_pools()
+        self.assertFalse(raptor.THREAD_POOLS)
+        self.assertFalse(raptor.thread_pool(3) is pools[0])
+        self.assertTrue((encoded(10, 9, workers=3, stripe_size=16).i_symbols ==
+                         encoded(10, 9).i_symbols).all())
+
+    def test_precomputation(self):
+        """
+        Tests that clearing U_upper through precomputed combinations gives
+        the same intermediate symbols with no more XORs
+        """
+        direct = encoded(300, use_precomputation=False)
+        precomputed = encoded(300)
+        self.assertTrue((direct.i_symbols == precomputed.i_symbols).all())
+        self.assertTrue(precomputed.stats['u_upper_precomputed_xors'] <
+                        precomputed.stats['u_upper_direct_xors'])
+        self.assertTrue(precomputed.stats['xors'] < direct.stats['xors'])
+
+    def test_u_lower_blocks(self):
+        """
+        Tests that eliminating U_lower in blocks of any width gives the
+        same intermediate symbols
+        """
+        expected = encoded(200, u_lower_block=1).i_symbols
+        for width in (2, 5, None):
+            encoder = encoded(200, u_lower_block=width)
+            self.assertTrue((encoder.i_symbols == expected).all())
+
+    def test_precode_rows(self):
+        """
+        Tests that the cached precode rows match the ldpc and hdpc sections
+        """
+        for k in (4, 10, 101, 1000):
+            r = RaptorR10(k)
+            expected = BitMatrix.from_bitarrays(r.ldpc_section() +
+                                                r.hdpc_section()).words
+            self.assertTrue((r.precode_rows() == expected).all())
+            self.assertTrue(r.precode_rows() is RaptorR10(k).precode_rows())
+
+    def test_neighbor_lists(self):
+        """
+        Tests that the batch triples and neighbors match those of single ids
+        """
+        r = RaptorR10(500)
+        esis = numpy.arange(0, 3000, 7)
+        d, a, b = r.triples(esis)
+        indptr, indices = r.neighbor_lists(esis)
+        for n, esi in enumerate(esis):
+            self.assertTrue((d[n], a[n], b[n]) == r.triple(esi))
+            self.assertTrue(indices[indptr[n]:indptr[n + 1]].tolist() ==
+                            r.neighbors(esi).tolist())
+
+    def test_neighbor_cache(self):
+        """
+        Tests that neighbors come from the source table or the cache as
+        uint16 and that lt rows match them
+        """
+        r = RaptorR10(50)
+        source = r.neighbors(3)
+        self.assertTrue(source.dtype == numpy.uint16)
+        self.assertTrue(source.base is r.source_neighbors()[1])
+
+        repair = r.neighbors(77)
+        self.assertTrue(r.neighbors(77) is repair)
+        self.assertTrue(r.lt_row(77).search(bitarray('1')) ==
+                        sorted(repair.tolist()))
+
+    def test_generate(self):
+        """
+        Tests that a batch of symbols fills the buffer given with the
+        symbols encoded one at a time
+        """
+        encoder = encoded(30, 5)
+        esis = range(25, 90, 3)
+        out = numpy.zeros((len(esis), 5), dtype='uint64')
+        self.assertTrue(encoder.generate(esis, out=out) is out)
+        for esi, symbol in zip(esis, out):
+            self.assertTrue((encoder.ltenc(esi) == symbol).all())
+        with self.assertRaises(ValueError):
+            encoder.generate(esis, out=out[1:])
+        with self.assertRaises(ValueError):
+            encoder.generate(esis, out=out.astype('uint32'))
+
+    def test_next_ids(self):
+        """
+        Tests that next_ids gives the ids next would produce and moves
+        past them
+        """
+        for use_optimal_esis in (False, True):
+            encoder = encoded(10, use_optimal_esis=use_optimal_esis)
+            expected = [encoder.next()[0] for i in xrange(5)]
+            encoder = encoded(10, use_optimal_esis=use_optimal_esis)
+            self.assertTrue(encoder.next_ids(4) == expected[:4])
+            self.assertTrue(encoder.next()[0] == expected[4])
+
+    def test_encoder_hard(self):
+        """
+        Tests that inverting A gives the intermediate symbols of the
+        schedule, for D of 64 and of 32 bit words
+        """
+        expected = encoded(12, 2)
+        for dtype in ('uint64', 'uint32'):
+            dtype_was = raptor.DTYPE
+            raptor.DTYPE = dtype
+            try:
+                hard = EncoderHard(12, source_symbols(12, 2))
+                bits = matrix.to_bool(hard.calculate_i_symbols_hard())
+            finally:
+                raptor.DTYPE = dtype_was
+
+            words = expected.i_symbols.astype(dtype)
+            shifts = numpy.arange(words.dtype.itemsize * 8).astype(dtype)
+            expected_bits = (words[:, :, None] >> shifts) & 1
+            self.assertTrue((bits == expected_bits.reshape(len(bits), -1)
+                             .astype(bool)).all())
+
+    def test_batch_encoder(self):
+        """
+        Tests that encoding blocks together gives the symbols of each block
+        encoded on its own
+        """
+        blocks = numpy.arange(3 * 12 * 4, dtype='uint64').reshape(3, 12, 4)
+        batch = BatchEncoder(12, blocks)
+        esis = range(40)
+        encoded = batch.generate_blocks(esis)
+        self.assertTrue(encoded.shape == (3, 40, 4))
+        for block, symbols in zip(blocks, encoded):
+            encoder = Encoder(12, list(enumerate(block.copy())))
+            self.assertTrue((encoder.generate(esis) == symbols).all())
+        with self.assertRaises(Exception):
+            BatchEncoder(12, blocks[:, 1:])
+
+    def test_peeling(self):
+        """
+        Tests that peeling rows with a single one before phase 1 gives the
+        same intermediate symbols
+        """
+        expected = encoded(100)
+        symbols = [(esi, expected.ltenc(esi)) for esi in xrange(50, 250)]
+        peeled = Encoder(100, symbols, use_peeling=True)
+        self.assertTrue(peeled.stats['peeled_rows'] > 0)
+        self.assertTrue((peeled.i_symbols == expected.i_symbols).all())
+
+    def test_inverse(self):
+        """
+        Tests that multiplying by the cached inverse of A gives the same
+        intermediate symbols as the schedule and is only used for small k
+        """
+        for k in (4, 10, 37, 64):
+            scheduled = encoded(k, 5, use_inverse=False)
+            encoder = encoded(k, 5)
+            self.assertTrue(encoder.inverse_is_cheaper())
+            self.assertTrue((encoder.i_symbols == scheduled.i_symbols).all())
+        self.assertFalse(encoded(100, 5).inverse_is_cheaper())
+
+    def test_source_inverse(self):
+        """
+        Tests that the cached inverse matches the columns of the inverse
+        of A for the source ids, including k past the 32 bits of DTYPE on
+        32 bit builds
+        """
+        for k in (10, 40, 64):
+            r = RaptorR10(k)
+            r.symbols = [(esi, None) for esi in xrange(k)]
+            expected = matrix.to_bool(matrix.inverse(r.a().tobitarrays()))
+            inverse, xors = r.source_inverse()
+            self.assertTrue(inverse.dtype == numpy.dtype('uint64'))
+            self.assertTrue((bitmatrix.unpack(inverse, k) ==
+                             expected[:, r.s + r.h:]).all())
+
+    def test_xor_fused(self):
+        """
+        Tests that combining rows a tile at a time matches xoring them
+        one after another, for tiles that do not divide the symbols
+        """
+        symbols = numpy.arange(5 * 70000, dtype='uint64').reshape(5, 70000)
+        for rows in ([3], [4, 0], [1, 2, 4, 0]):
+            target = numpy.empty(70000, dtype='uint64')
+            RaptorR10.xor_fused(symbols, rows, target)
+            expected = symbols[rows[0]].copy()
+            for row in rows[1:]:
+                expected ^= symbols[row]
+            self.assertTrue((target == expected).all())
+
+    def test_hdpc_inactivation(self):
+        """
+        Tests that leaving the hdpc rows out of phase 1 gives the same
+        intermediate symbols with their columns inactivated
+        """
+        expected = encoded(150)
+        encoder = encoded(150, use_hdpc_inactivation=True)
+        self.assertTrue(encoder.stats['inactivated'] >= encoder.h)
+        self.assertTrue((encoder.i_symbols == expected.i_symbols).all())
+
+        symbols = [(esi, expected.ltenc(esi)) for esi in xrange(60, 260)]
+        for use_peeling in (False, True):
+            decoder = Decoder(150, list(symbols), use_peeling=use_peeling,
+                              use_hdpc_inactivation=True)
+            decoder.decode()
+            self.assertTrue((decoder.i_symbols == expected.i_symbols).all())
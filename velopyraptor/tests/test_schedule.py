@@ -1,7 +1,10 @@
 import os
+import random
 import sys
 import unittest
 
+import numpy
+
 # Parent holds the encoding/decoding python files
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -61,3 +64,97 @@ class TestSchedule(unittest.TestCase):
         source_row, target_row = s.xors[0]
         self.assertTrue(source_row == 1)
         self.assertTrue(target_row == 0)
+
+    def apply(self, s, rows):
+        """
+        Applies the xors of s to integer rows plus the scratch rows
+
+        Returns the list of rows d[0..l-1]
+        """
+        rows = rows + [0] * s.temps
+        for source, target in s.xors:
+            rows[target] ^= rows[source]
+        return [rows[s.d[i]] for i in xrange(len(s.c))]
+
+    def test_optimize_dead_and_cancelled(self):
+        """
+        Tests that XORs into rows beyond l and repeated XORs are dropped
+        """
+        s = Schedule(2, 4)
+        s.xor(0, 3)
+        s.xor(0, 2)
+        s.xor(0, 3)
+        s.xor(3, 1)
+        removed = s.optimize()
+        self.assertTrue(s.xors == [(2, 0)])
+        self.assertTrue(removed == {"dead": 1, "cancelled": 2, "shared": 0})
+
+    def test_optimize_shared(self):
+        """
+        Tests that a pair of sources shared by several targets is built
+        once and that the optimized schedule computes the same rows
+        """
+        s = Schedule(5, 7)
+        for target in xrange(5):
+            s.xor(target, 5)
+            s.xor(target, 6)
+        rows = [random.getrandbits(32) for i in xrange(7)]
+        expected = self.apply(s, rows)
+
+        removed = s.optimize()
+        self.assertTrue(s.temps == 1)
+        self.assertTrue(len(s.xors) == 7)
+        self.assertTrue(removed["shared"] == 3)
+        self.assertTrue(self.apply(s, rows) == expected)
+
+    def test_optimize_random(self):
+        """
+        Tests that optimizing random schedules keeps their result
+        """
+        rnd = random.Random(3)
+        for trial in xrange(20):
+            s = Schedule(8, 12)
+            for n in xrange(60):
+                s.xor(rnd.randrange(12), rnd.randrange(12))
+            s.xors = [xor for xor in s.xors if xor[0] != xor[1]]
+            rows = [rnd.getrandbits(32) for i in xrange(12)]
+            expected = self.apply(s, rows)
+            s.optimize(max_temps=2)
+            self.assertTrue(self.apply(s, rows) == expected)
+
+    def test_waves(self):
+        """
+        Tests that applying the waves at once matches applying the xors
+        in order
+        """
+        rnd = random.Random(5)
+        s = Schedule(8, 12)
+        for n in xrange(80):
+            s.xor(rnd.randrange(12), rnd.randrange(12))
+        rows = [rnd.getrandbits(32) for i in xrange(12)]
+        expected = self.apply(s, rows)
+
+        d = numpy.array(rows, dtype='uint64')
+        for sources, targets in s.waves():
+            self.assertTrue(len(set(targets)) == len(targets))
+            d[targets] ^= d[sources]
+        self.assertTrue([d[s.d[i]] for i in xrange(8)] == expected)
+
+    def test_slice(self):
+        """
+        Tests that a slice computes the rows it was sliced for with only
+        the XORs they depend on
+        """
+        rnd = random.Random(7)
+        s = Schedule(8, 12)
+        for n in xrange(40):
+            s.xor(rnd.randrange(12), rnd.randrange(12))
+        s.optimize()
+        rows = [rnd.getrandbits(32) for i in xrange(12)]
+        expected = self.apply(s, rows)
+
+        sliced = s.slice([s.d[2], s.d[5]])
+        self.assertTrue(len(sliced.xors) < len(s.xors))
+        result = self.apply(sliced, rows)
+        self.assertTrue(result[2] == expected[2])
+        self.assertTrue(result[5] == expected[5])